@@ -0,0 +1,386 @@
+import functools
+import heapq
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from pyrogram import errors
+
+from api.models import Channel, Post, PostWatch, PublishedPost
+from social_networks.tg import TelegramPublisher, Priority
+
+PREWARM = "prewarm"
+SEND = "send"
+
+
+@dataclass(order=True)
+class _Slot:
+    at: float
+    seq: int
+    stage: str = field(compare=False)
+    post_id: int = field(compare=False)
+    schedule_time: datetime = field(compare=False)
+    # shared by the two slots of one ``schedule`` call
+    generation: int = field(compare=False)
+
+
+@dataclass
+class _BindingSend:
+    publisher: TelegramPublisher
+    channels: list[Channel]
+
+
+@dataclass
+class _Dispatch:
+    post: Post
+    sends: list[_BindingSend]
+    lags: list[float] = field(default_factory=list)
+    # channels that failed other than with an RPC error; the post stays
+    # unsent so that sync retries them
+    failed: bool = False
+    futures: list[Future] = field(default_factory=list)
+    pending: int = 0
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    # resolved once the post is marked sent or left for a retry
+    finished: Future = field(default_factory=Future)
+
+
+class PublishDispatcher:
+    """Releases scheduled posts at their ``schedule_time``.
+
+    Slots wait in a heap on one dispatcher thread, so no worker sleeps
+    until its post is due. ``prewarm`` seconds before a slot the
+    publishers of every target binding are leased and warmed up; at the
+    slot the sends of all bindings are handed to the workers at once,
+    the channels of one binding in order. The lag from the slot to each
+    sent message is stored on the publication, the largest one on the
+    post.
+    """
+
+    def __init__(self, prewarm: float, max_workers: int, misfire_grace: float):
+        self.prewarm = prewarm
+        self.misfire_grace = timedelta(seconds=misfire_grace)
+        self._heap: list[_Slot] = []
+        # the send slot each post is due at; heap entries of other
+        # generations are stale and skipped
+        self._scheduled: dict[int, _Slot] = {}
+        self._prepared: dict[int, Future] = {}
+        self._sending: set[int] = set()
+        self._seq = itertools.count()
+        self._condition = threading.Condition()
+        self._workers = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="publish"
+        )
+        self._thread: threading.Thread | None = None
+        self._stopped = False
+
+    def start(self):
+        with self._condition:
+            if self._thread is not None:
+                return
+            self._stopped = False
+            self._thread = threading.Thread(
+                target=self._run, name="publish-dispatcher", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            thread, self._thread = self._thread, None
+            self._stopped = True
+            self._condition.notify()
+        if thread is not None:
+            thread.join()
+
+    def schedule(self, post_id: int, schedule_time: datetime):
+        """Send a post at ``schedule_time``, replacing its previous slot.
+
+        Slots in the past are sent right away. Scheduling a post again at
+        the same time keeps its pending slot.
+        """
+        at = schedule_time.timestamp()
+        with self._condition:
+            current = self._scheduled.get(post_id)
+            if current is not None and current.schedule_time == schedule_time:
+                return
+            abandoned = self._prepared.pop(post_id, None)
+            generation = next(self._seq)
+            for stage, stage_at in ((PREWARM, at - self.prewarm), (SEND, at)):
+                slot = _Slot(
+                    stage_at,
+                    next(self._seq),
+                    stage,
+                    post_id,
+                    schedule_time,
+                    generation,
+                )
+                heapq.heappush(self._heap, slot)
+            self._scheduled[post_id] = slot
+            self._condition.notify()
+        if abandoned is not None:
+            abandoned.add_done_callback(self._abandon)
+
+    def cancel(self, post_id: int):
+        with self._condition:
+            self._scheduled.pop(post_id, None)
+            abandoned = self._prepared.pop(post_id, None)
+        if abandoned is not None:
+            abandoned.add_done_callback(self._abandon)
+
+    def sync(self):
+        """Match the slots to the unsent scheduled posts in the database.
+
+        Picks up posts scheduled by other processes and those left over
+        from before a restart, unless they are past ``misfire_grace``.
+        """
+        # taken before the query: a post whose send finishes in between
+        # is still in ``sending`` here, or already sent in the database
+        with self._condition:
+            scheduled = {
+                post_id: slot.schedule_time
+                for post_id, slot in self._scheduled.items()
+            }
+            sending = set(self._sending)
+        now = timezone.now()
+        due = dict(
+            Post.objects.filter(
+                is_sent=False,
+                schedule_time__gte=now - self.misfire_grace,
+            ).values_list("id", "schedule_time")
+        )
+        for post_id, schedule_time in due.items():
+            if post_id not in sending and scheduled.get(post_id) != (
+                schedule_time
+            ):
+                self.schedule(post_id, schedule_time)
+        for post_id in scheduled.keys() - due.keys():
+            self.cancel(post_id)
+
+    def send_now(self, post_id: int):
+        """Publish a post right away and wait until it is sent."""
+        with self._condition:
+            self._scheduled.pop(post_id, None)
+            abandoned = self._prepared.pop(post_id, None)
+            self._sending.add(post_id)
+        if abandoned is not None:
+            abandoned.add_done_callback(self._abandon)
+        at = time.time()
+        try:
+            dispatch = self._workers.submit(self._prepare, post_id).result()
+        except Exception:
+            with self._condition:
+                self._sending.discard(post_id)
+            raise
+        if dispatch is None:
+            with self._condition:
+                self._sending.discard(post_id)
+            return
+        self._release(at, dispatch).result()
+
+    def _run(self):
+        while True:
+            abandoned = prepared = None
+            with self._condition:
+                slot = None
+                while not self._stopped:
+                    if not self._heap:
+                        self._condition.wait()
+                        continue
+                    delay = self._heap[0].at - time.time()
+                    if delay <= 0:
+                        slot = heapq.heappop(self._heap)
+                        break
+                    self._condition.wait(delay)
+                if self._stopped:
+                    return
+                current = self._scheduled.get(slot.post_id)
+                if current is None or current.generation != slot.generation:
+                    continue
+                if slot.stage == PREWARM:
+                    abandoned = self._prepared.pop(slot.post_id, None)
+                    self._prepared[slot.post_id] = self._workers.submit(
+                        self._prepare, slot.post_id
+                    )
+                else:
+                    del self._scheduled[slot.post_id]
+                    self._sending.add(slot.post_id)
+                    prepared = self._prepared.pop(slot.post_id, None)
+                    if prepared is None:
+                        prepared = self._workers.submit(
+                            self._prepare, slot.post_id
+                        )
+            if abandoned is not None:
+                abandoned.add_done_callback(self._abandon)
+            if prepared is not None:
+                prepared.add_done_callback(
+                    functools.partial(self._release_prepared, slot)
+                )
+
+    def _prepare(self, post_id: int) -> "_Dispatch | None":
+        try:
+            post = Post.objects.get(id=post_id)
+            if post.is_sent:
+                # by another process, or by a slot a stale sync replaced
+                logging.warning(f"Post {post_id} is already sent")
+                return None
+            # channels a failed attempt already reached are not sent again
+            channels = post.target_channels.exclude(
+                id__in=PublishedPost.objects.filter(post=post).values(
+                    "channel_id"
+                )
+            )
+            by_binding: dict[int, list[Channel]] = {}
+            for channel in channels.select_related("binding"):
+                by_binding.setdefault(channel.binding_id, []).append(channel)
+
+            dispatch = _Dispatch(post, [])
+            for channels in by_binding.values():
+                binding = channels[0].binding
+                try:
+                    publisher = TelegramPublisher(
+                        binding, priority=Priority.PUBLISH
+                    )
+                    publisher.start()
+                except Exception:
+                    logging.exception(
+                        f"Failed to connect binding {binding.id} "
+                        f"for post {post_id}"
+                    )
+                    dispatch.failed = True
+                    continue
+                dispatch.sends.append(_BindingSend(publisher, channels))
+                try:
+                    publisher.warm_up(
+                        [channel.channel_id for channel in channels], post
+                    )
+                except Exception:
+                    # publish does the same lookups again
+                    logging.exception(
+                        f"Failed to warm up binding {binding.id} "
+                        f"for post {post_id}"
+                    )
+            return dispatch
+        finally:
+            connection.close()
+
+    def _release_prepared(self, slot: _Slot, prepared: Future):
+        try:
+            dispatch = prepared.result()
+        except Exception:
+            logging.exception(f"Failed to prepare post {slot.post_id}")
+            dispatch = None
+        if dispatch is None:
+            with self._condition:
+                self._sending.discard(slot.post_id)
+            return
+        self._release(slot.at, dispatch)
+
+    def _release(self, at: float, dispatch: _Dispatch) -> Future:
+        dispatch.pending = len(dispatch.sends)
+        if not dispatch.sends:
+            self._finish(dispatch)
+            return dispatch.finished
+        dispatch.futures = [
+            self._workers.submit(self._send, at, dispatch, send)
+            for send in dispatch.sends
+        ]
+        for future in dispatch.futures:
+            future.add_done_callback(functools.partial(self._sent, dispatch))
+        return dispatch.finished
+
+    def _send(self, at: float, dispatch: _Dispatch, send: _BindingSend):
+        post = dispatch.post
+        try:
+            for channel in send.channels:
+                logging.info(f"Sending {post.id} to {channel.channel_id}")
+                try:
+                    message = send.publisher.publish(channel.channel_id, post)
+                    lag = time.time() - at
+                    PublishedPost.objects.create(
+                        post=post,
+                        channel=channel,
+                        message_id=message.id,
+                        published_at=timezone.now(),
+                        send_lag=lag,
+                    )
+                except Exception as e:
+                    logging.exception(
+                        f"Failed to send post {post.id} "
+                        f"to {channel.channel_id}"
+                    )
+                    # rejected by Telegram, sending again would not help
+                    if not isinstance(e, errors.RPCError):
+                        dispatch.failed = True
+                    continue
+                with dispatch.lock:
+                    dispatch.lags.append(lag)
+        finally:
+            send.publisher.stop()
+            connection.close()
+
+    def _sent(self, dispatch: _Dispatch, future: Future):
+        with dispatch.lock:
+            dispatch.pending -= 1
+            finished = dispatch.pending == 0
+        if not finished:
+            return
+        try:
+            self._finish(dispatch)
+        finally:
+            connection.close()
+
+    def _finish(self, dispatch: _Dispatch):
+        post = dispatch.post
+        for future in dispatch.futures:
+            if future.exception() is not None:
+                logging.error(
+                    f"Failed to send post {post.id}",
+                    exc_info=future.exception(),
+                )
+                dispatch.failed = True
+        try:
+            if dispatch.failed:
+                logging.error(
+                    f"Post {post.id} is left unsent, "
+                    f"sent to {len(dispatch.lags)} channels"
+                )
+                return
+            self._mark_sent(dispatch)
+        finally:
+            with self._condition:
+                self._sending.discard(post.id)
+            dispatch.finished.set_result(None)
+
+    def _mark_sent(self, dispatch: _Dispatch):
+        post = dispatch.post
+        post.is_sent = True
+        post.send_lag = max(dispatch.lags, default=None)
+        post.save(update_fields=["is_sent", "send_lag"])
+        # a retry may find every channel reached by the failed attempt
+        if PublishedPost.objects.filter(post=post).exists():
+            PostWatch.objects.create(post=post)
+        if dispatch.lags:
+            logging.info(
+                f"Sent post {post.id} to {len(dispatch.lags)} channels, "
+                f"lag {post.send_lag:.3f}s"
+            )
+
+    def _abandon(self, prepared: Future):
+        if prepared.exception() is not None or prepared.result() is None:
+            return
+        for send in prepared.result().sends:
+            send.publisher.stop()
+
+
+dispatcher = PublishDispatcher(
+    prewarm=settings.PUBLISH_PREWARM,
+    max_workers=settings.PUBLISH_MAX_WORKERS,
+    misfire_grace=settings.PUBLISH_MISFIRE_GRACE,
+)
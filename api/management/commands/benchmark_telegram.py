@@ -0,0 +1,161 @@
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.dispatcher import PublishDispatcher
+from api.models import (
+    User,
+    Project,
+    UserTelegramBinding,
+    Channel,
+    Post,
+    PublishedPost,
+)
+from api.scheduler import force_watch_for_post
+from social_networks.pool import client_pool
+from social_networks.simulator import SimulatedTelegram, SimulatedClient
+
+
+class Command(BaseCommand):
+    help = (
+        "Publish and watch posts against the in-memory Telegram simulator "
+        "and report the throughput. Everything created is removed again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--bindings", type=int, default=5)
+        parser.add_argument(
+            "--channels", type=int, default=100, help="channels per binding"
+        )
+        parser.add_argument("--posts", type=int, default=2)
+        parser.add_argument("--watch-cycles", type=int, default=3)
+        parser.add_argument("--latency", type=float, default=0.05)
+        parser.add_argument("--jitter", type=float, default=0.01)
+        parser.add_argument("--flood-rate", type=float, default=0.0)
+        parser.add_argument("--flood-seconds", type=int, default=1)
+        parser.add_argument("--view-growth", type=int, default=20)
+        parser.add_argument(
+            "--slot-delay",
+            type=float,
+            default=3.0,
+            help="seconds until the posts' shared slot",
+        )
+        parser.add_argument("--prewarm", type=float, default=2.0)
+
+    def handle(self, *args, **options):
+        telegram = SimulatedTelegram(
+            latency=options["latency"],
+            jitter=options["jitter"],
+            flood_rate=options["flood_rate"],
+            flood_seconds=options["flood_seconds"],
+            view_growth=options["view_growth"],
+        )
+        client_pool.close_all()
+        client_factory = client_pool.client_factory
+        client_pool.client_factory = (
+            lambda binding_id, session_string: SimulatedClient(
+                telegram, binding_id
+            )
+        )
+        owner = User.objects.create_user(f"benchmark-{uuid.uuid4().hex[:8]}")
+        try:
+            posts = self._populate(telegram, owner, options)
+            self._publish(posts, options["slot_delay"], options["prewarm"])
+            self._watch(posts[0], options["watch_cycles"])
+            self._report(telegram)
+        finally:
+            client_pool.close_all()
+            client_pool.client_factory = client_factory
+            owner.delete()
+
+    def _populate(self, telegram, owner, options) -> list[Post]:
+        project = Project.objects.create(name="benchmark", owner=owner)
+        channels = []
+        for i in range(options["bindings"]):
+            binding = UserTelegramBinding.objects.create(
+                account_id=i,
+                name=f"benchmark-{i}",
+                session_string="simulated",
+                owner=owner,
+            )
+            for j in range(options["channels"]):
+                title = f"benchmark-{i}-{j}"
+                channels.append(
+                    Channel(
+                        project=project,
+                        type="telegram",
+                        is_group=False,
+                        name=title,
+                        channel_id=telegram.add_channel(binding.id, title),
+                        binding=binding,
+                    )
+                )
+        Channel.objects.bulk_create(channels)
+
+        posts = []
+        for i in range(options["posts"]):
+            post = Post.objects.create(
+                project=project, name=f"benchmark-{i}", text="benchmark"
+            )
+            post.target_channels.set(channels)
+            posts.append(post)
+        return posts
+
+    def _publish(self, posts: list[Post], slot_delay: float, prewarm: float):
+        dispatcher = PublishDispatcher(
+            prewarm=prewarm,
+            max_workers=settings.PUBLISH_MAX_WORKERS,
+            misfire_grace=0,
+        )
+        slot = timezone.now() + timedelta(seconds=slot_delay)
+        for post in posts:
+            post.schedule_time = slot
+            post.save(update_fields=["schedule_time"])
+            dispatcher.schedule(post.id, slot)
+        dispatcher.start()
+        try:
+            ids = [post.id for post in posts]
+            while Post.objects.filter(id__in=ids, is_sent=False).exists():
+                time.sleep(0.1)
+        finally:
+            dispatcher.stop()
+
+        lags = sorted(
+            PublishedPost.objects.filter(post__in=posts).values_list(
+                "send_lag", flat=True
+            )
+        )
+        if not lags:
+            self.stdout.write("publish: nothing was sent")
+            return
+        self.stdout.write(
+            f"publish: {len(lags)} messages, {len(lags) / lags[-1]:.1f}/s "
+            f"after the slot; send lag p50 {lags[len(lags) // 2]:.3f}s, "
+            f"first {lags[0]:.3f}s, last {lags[-1]:.3f}s"
+        )
+
+    def _watch(self, post: Post, cycles: int):
+        channels = post.target_channels.count()
+        for cycle in range(cycles):
+            started = time.monotonic()
+            force_watch_for_post(post)
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f"watch cycle {cycle + 1}: {channels} channels in "
+                f"{elapsed:.2f}s ({channels / elapsed:.1f}/s)"
+            )
+
+    def _report(self, telegram: SimulatedTelegram):
+        counts = {}
+        flood_waits = 0
+        for account in telegram.accounts.values():
+            flood_waits += account.flood_waits
+            for name, count in account.rpc_counts.items():
+                counts[name] = counts.get(name, 0) + count
+        for name, count in sorted(counts.items()):
+            self.stdout.write(f"{name}: {count}")
+        self.stdout.write(f"injected FLOOD_WAITs: {flood_waits}")
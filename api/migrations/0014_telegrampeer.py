@@ -0,0 +1,30 @@
+# Generated by Django 5.0.2 on 2026-10-18 16:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_postfile_is_video_note'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TelegramPeer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('peer_id', models.BigIntegerField()),
+                ('access_hash', models.BigIntegerField(null=True)),
+                ('type', models.CharField(max_length=16)),
+                ('username', models.CharField(max_length=255, null=True)),
+                ('phone_number', models.CharField(max_length=32, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('binding', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='peers', to='api.usertelegrambinding')),
+            ],
+            options={
+                'unique_together': {('binding', 'peer_id')},
+            },
+        ),
+    ]
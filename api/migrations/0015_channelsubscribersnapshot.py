@@ -0,0 +1,26 @@
+# Generated by Django 5.0.2 on 2026-10-18 16:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_telegrampeer'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChannelSubscriberSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subscribers', models.IntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('channel', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='subscriber_snapshots', to='api.channel')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['channel', '-created_at'], name='api_channel_channel_487d5c_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.0.2 on 2026-10-18 16:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_channelsubscribersnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FilePreload',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('uploading', 'Uploading'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=16)),
+                ('uploaded', models.BigIntegerField(default=0)),
+                ('total', models.BigIntegerField(default=0)),
+                ('error', models.TextField(blank=True, default='')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('binding', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.usertelegrambinding')),
+                ('file', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='preloads', to='api.postfile')),
+            ],
+            options={
+                'unique_together': {('file', 'binding')},
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.2 on 2026-10-18 16:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_filepreload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fileuploadedtotelegram',
+            name='media_type',
+            field=models.CharField(blank=True, default='', max_length=16),
+        ),
+        migrations.AddField(
+            model_name='fileuploadedtotelegram',
+            name='telegram_file_id',
+            field=models.TextField(blank=True, default=''),
+        ),
+    ]
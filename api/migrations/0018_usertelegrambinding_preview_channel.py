@@ -0,0 +1,23 @@
+# Generated by Django 5.0.2 on 2026-10-18 16:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_fileuploadedtotelegram_telegram_file_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usertelegrambinding',
+            name='preview_access_hash',
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='usertelegrambinding',
+            name='preview_channel_id',
+            field=models.BigIntegerField(null=True),
+        ),
+    ]
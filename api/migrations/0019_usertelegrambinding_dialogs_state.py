@@ -0,0 +1,18 @@
+# Generated by Django 5.0.2 on 2026-10-18 16:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_usertelegrambinding_preview_channel'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usertelegrambinding',
+            name='dialogs_state',
+            field=models.JSONField(null=True),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.0.2 on 2026-10-18 16:45
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_usertelegrambinding_dialogs_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='filepreload',
+            name='parts_uploaded',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='filepreload',
+            name='telegram_upload_id',
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.CreateModel(
+            name='FileUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('size', models.BigIntegerField()),
+                ('received', models.BigIntegerField(default=0)),
+                ('sha256', models.CharField(blank=True, default='', max_length=64)),
+                ('status', models.CharField(choices=[('receiving', 'Receiving'), ('done', 'Done'), ('failed', 'Failed')], default='receiving', max_length=16)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('file', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='upload', to='api.postfile')),
+            ],
+        ),
+    ]
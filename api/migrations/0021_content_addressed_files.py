@@ -0,0 +1,38 @@
+# Generated by Django 5.0.2 on 2026-10-18 16:47
+
+import api.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0020_fileupload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fileuploadedtotelegram',
+            name='sha256',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='postfile',
+            name='name',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='postfile',
+            name='sha256',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='postfile',
+            name='file',
+            field=models.FileField(max_length=255, upload_to=api.models.get_filepath),
+        ),
+        migrations.AddIndex(
+            model_name='fileuploadedtotelegram',
+            index=models.Index(fields=['sha256', 'binding'], name='api_fileupl_sha256_1e229b_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.0.2 on 2026-10-18 16:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0021_content_addressed_files'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WatchCycle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField()),
+                ('duration', models.FloatField()),
+                ('bindings', models.IntegerField()),
+                ('channels', models.IntegerField()),
+                ('publications', models.IntegerField()),
+                ('failed_channels', models.IntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,94 @@
+# Generated by Django 5.0.2 on 2026-10-18 16:54
+
+from datetime import timedelta
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Min
+from django.utils import timezone
+
+
+def fill_schedule(apps, schema_editor):
+    # without this every existing publication would look published now
+    # and be polled through all tiers again
+    PublishedPost = apps.get_model('api', 'PublishedPost')
+    PostWatch = apps.get_model('api', 'PostWatch')
+    now = timezone.now()
+    tiers = [
+        (timedelta(seconds=age), timedelta(seconds=interval))
+        for age, interval, _ in settings.WATCH_TIERS
+    ]
+    # watches are created when a post is sent, schedule_time is the
+    # fallback once they are purged
+    first_watch = dict(
+        PostWatch.objects.values('post_id')
+        .annotate(first=Min('created_at'))
+        .values_list('post_id', 'first')
+    )
+    publications = []
+    for publication in PublishedPost.objects.select_related('post'):
+        published_at = (
+            first_watch.get(publication.post_id)
+            or publication.post.schedule_time
+        )
+        if published_at is None or published_at > now:
+            continue
+        publication.published_at = published_at
+        age = now - published_at
+        tier = next((tier for tier in tiers if age < tier[0]), None)
+        if tier is None:
+            publication.frozen = True
+        else:
+            # the next poll in the publication's own phase spreads the
+            # backlog over the interval instead of polling it all now
+            interval = tier[1]
+            publication.next_poll_at = (
+                published_at + interval * (age // interval + 1)
+            )
+        publications.append(publication)
+    PublishedPost.objects.bulk_update(
+        publications,
+        ['published_at', 'next_poll_at', 'frozen'],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0022_watchcycle'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='publishedpost',
+            name='frozen',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='publishedpost',
+            name='last_views',
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='publishedpost',
+            name='next_poll_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='publishedpost',
+            name='published_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='publishedpost',
+            name='stable_polls',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='publishedpost',
+            index=models.Index(fields=['frozen', 'next_poll_at', 'published_at'], name='api_publish_frozen_011f3b_idx'),
+        ),
+        migrations.RunPython(fill_schedule, migrations.RunPython.noop),
+    ]
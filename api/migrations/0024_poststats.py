@@ -0,0 +1,52 @@
+# Generated by Django 5.0.2 on 2026-10-18 16:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_post_stats(apps, schema_editor):
+    PostMeasurement = apps.get_model('api', 'PostMeasurement')
+    PostStats = apps.get_model('api', 'PostStats')
+    # one ordered scan, the first row of each post and channel is the
+    # latest; a per-pair subquery has no index to use at this point
+    latest = PostMeasurement.objects.order_by(
+        'post_id', 'channel_id', '-created_at', '-id'
+    )
+    stats = {}
+    for measurement in latest.iterator():
+        key = (measurement.post_id, measurement.channel_id)
+        if key not in stats:
+            stats[key] = PostStats(
+                post_id=measurement.post_id,
+                channel_id=measurement.channel_id,
+                views=measurement.views,
+                engagement_rate=measurement.engagement_rate,
+                reactions=measurement.reactions,
+            )
+    PostStats.objects.bulk_create(stats.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0023_publishedpost_schedule'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('views', models.IntegerField(default=0)),
+                ('engagement_rate', models.FloatField(default=0)),
+                ('reactions', models.IntegerField(default=0)),
+                ('channel', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.channel')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.post')),
+            ],
+            options={
+                'unique_together': {('post', 'channel')},
+            },
+        ),
+        migrations.RunPython(fill_post_stats, migrations.RunPython.noop),
+    ]
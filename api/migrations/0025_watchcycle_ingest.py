@@ -0,0 +1,28 @@
+# Generated by Django 5.0.2 on 2026-10-18 16:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0024_poststats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='watchcycle',
+            name='measurements',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='watchcycle',
+            name='notifications',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='watchcycle',
+            name='write_duration',
+            field=models.FloatField(default=0),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.0.2 on 2026-10-18 16:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0025_watchcycle_ingest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostMeasurementRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=8)),
+                ('bucket', models.DateTimeField()),
+                ('samples', models.IntegerField(default=0)),
+                ('views_min', models.IntegerField()),
+                ('views_max', models.IntegerField()),
+                ('views_last', models.IntegerField()),
+                ('engagement_rate_min', models.FloatField()),
+                ('engagement_rate_max', models.FloatField()),
+                ('engagement_rate_last', models.FloatField()),
+                ('reactions_min', models.IntegerField()),
+                ('reactions_max', models.IntegerField()),
+                ('reactions_last', models.IntegerField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='postmeasurement',
+            index=models.Index(fields=['post', 'created_at'], name='api_postmea_post_id_c099b3_idx'),
+        ),
+        migrations.AddField(
+            model_name='postmeasurementrollup',
+            name='channel',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.channel'),
+        ),
+        migrations.AddField(
+            model_name='postmeasurementrollup',
+            name='post',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.post'),
+        ),
+        migrations.AddIndex(
+            model_name='postmeasurementrollup',
+            index=models.Index(fields=['resolution', 'bucket'], name='api_postmea_resolut_f70dfe_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='postmeasurementrollup',
+            unique_together={('post', 'channel', 'resolution', 'bucket')},
+        ),
+    ]
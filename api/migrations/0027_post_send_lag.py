@@ -0,0 +1,23 @@
+# Generated by Django 5.0.2 on 2026-10-18 17:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0026_postmeasurementrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='send_lag',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='publishedpost',
+            name='send_lag',
+            field=models.FloatField(null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.2 on 2026-10-18 17:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0027_post_send_lag'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usertelegrambinding',
+            name='channels_diff',
+            field=models.JSONField(null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.2 on 2026-10-18 17:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0028_usertelegrambinding_channels_diff'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='filepreload',
+            name='attempts',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.0.2 on 2026-10-18 17:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0029_filepreload_attempts'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='postmeasurementrollup',
+            name='api_postmea_resolut_f70dfe_idx',
+        ),
+        migrations.AddIndex(
+            model_name='postmeasurement',
+            index=models.Index(fields=['created_at', 'id'], name='api_postmea_created_7f1020_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='postmeasurementrollup',
+            index=models.Index(fields=['resolution', 'bucket', 'id'], name='api_postmea_resolut_fcd62b_idx'),
+        ),
+    ]
@@ -1,5 +1,8 @@
+import uuid
+
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.utils import timezone
 
 
 class User(AbstractUser):
@@ -12,6 +15,26 @@ class UserTelegramBinding(models.Model):
     session_string = models.TextField()
     owner = models.ForeignKey(to=User, on_delete=models.CASCADE)
     fetched_channels = models.JSONField(default=list)
+    preview_channel_id = models.BigIntegerField(null=True)
+    preview_access_hash = models.BigIntegerField(null=True)
+    dialogs_state = models.JSONField(null=True)
+    # what the last channel refresh added, removed and renamed
+    channels_diff = models.JSONField(null=True)
+
+
+class TelegramPeer(models.Model):
+    binding = models.ForeignKey(
+        to=UserTelegramBinding, on_delete=models.CASCADE, related_name="peers"
+    )
+    peer_id = models.BigIntegerField()
+    access_hash = models.BigIntegerField(null=True)
+    type = models.CharField(max_length=16)
+    username = models.CharField(max_length=255, null=True)
+    phone_number = models.CharField(max_length=32, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("binding", "peer_id")
 
 
 class Project(models.Model):
@@ -39,6 +62,8 @@ class Post(models.Model):
     )
     schedule_time = models.DateTimeField(null=True)
     is_sent = models.BooleanField(default=False)
+    # seconds from schedule_time until the last channel got the post
+    send_lag = models.FloatField(null=True)
     stat_notified = models.BooleanField(default=False)
     stage = models.ForeignKey(to="WorkflowStage",
                               on_delete=models.SET_NULL, null=True)
@@ -59,6 +84,29 @@ class Channel(models.Model):
     )
 
 
+class ChannelSubscriberSnapshot(models.Model):
+    channel = models.ForeignKey(
+        to=Channel,
+        on_delete=models.CASCADE,
+        related_name="subscriber_snapshots",
+    )
+    subscribers = models.IntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["channel", "-created_at"])]
+
+    @classmethod
+    def latest(cls, channel, max_age):
+        return (
+            cls.objects.filter(
+                channel=channel, created_at__gte=timezone.now() - max_age
+            )
+            .order_by("-created_at")
+            .first()
+        )
+
+
 class IssuedToken(models.Model):
     token = models.TextField()
     user = models.ForeignKey(to=User, on_delete=models.CASCADE)
@@ -71,6 +119,18 @@ class PostWatch(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
 
 
+class WatchCycle(models.Model):
+    started_at = models.DateTimeField()
+    duration = models.FloatField()
+    bindings = models.IntegerField()
+    channels = models.IntegerField()
+    publications = models.IntegerField()
+    failed_channels = models.IntegerField(default=0)
+    measurements = models.IntegerField(default=0)
+    notifications = models.IntegerField(default=0)
+    write_duration = models.FloatField(default=0)
+
+
 class PostMeasurement(models.Model):
     post = models.ForeignKey(to=Post, on_delete=models.CASCADE)
     channel = models.ForeignKey(to=Channel, on_delete=models.CASCADE)
@@ -79,6 +139,61 @@ class PostMeasurement(models.Model):
     engagement_rate = models.FloatField()
     reactions = models.IntegerField()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["post", "created_at"]),
+            # compaction walks expired measurements in this order
+            models.Index(fields=["created_at", "id"]),
+        ]
+
+
+class PostMeasurementRollup(models.Model):
+    """Measurements of a post in a channel aggregated over one bucket.
+
+    Raw measurements are compacted into hourly and then daily rollups as
+    they age, see ``STATS_RETENTION``.
+    """
+
+    class Resolution(models.TextChoices):
+        HOUR = "hour"
+        DAY = "day"
+
+    post = models.ForeignKey(to=Post, on_delete=models.CASCADE)
+    channel = models.ForeignKey(to=Channel, on_delete=models.CASCADE)
+    resolution = models.CharField(max_length=8, choices=Resolution.choices)
+    bucket = models.DateTimeField()
+    samples = models.IntegerField(default=0)
+    views_min = models.IntegerField()
+    views_max = models.IntegerField()
+    views_last = models.IntegerField()
+    engagement_rate_min = models.FloatField()
+    engagement_rate_max = models.FloatField()
+    engagement_rate_last = models.FloatField()
+    reactions_min = models.IntegerField()
+    reactions_max = models.IntegerField()
+    reactions_last = models.IntegerField()
+
+    class Meta:
+        unique_together = ("post", "channel", "resolution", "bucket")
+        indexes = [models.Index(fields=["resolution", "bucket", "id"])]
+
+
+class PostStats(models.Model):
+    """Latest measurement of a post in a channel.
+
+    Kept next to the ``PostMeasurement`` history so that threshold
+    checks read one row instead of scanning it.
+    """
+    post = models.ForeignKey(to=Post, on_delete=models.CASCADE)
+    channel = models.ForeignKey(to=Channel, on_delete=models.CASCADE)
+    updated_at = models.DateTimeField(auto_now=True)
+    views = models.IntegerField(default=0)
+    engagement_rate = models.FloatField(default=0)
+    reactions = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ("post", "channel")
+
 
 class Notification(models.Model):
     user = models.ForeignKey(to=User, on_delete=models.CASCADE)
@@ -104,8 +219,13 @@ class PostFile(models.Model):
     post = models.ForeignKey(
         to=Post, on_delete=models.CASCADE, related_name='files'
     )
-    file = models.FileField(upload_to=get_filepath)
+    file = models.FileField(upload_to=get_filepath, max_length=255)
     is_video_note = models.BooleanField(default=False)
+    # original file name; stored files are named by their content hash
+    name = models.CharField(max_length=255, blank=True, default="")
+    sha256 = models.CharField(
+        max_length=64, blank=True, default="", db_index=True
+    )
 
 
 class FileUploadedToTelegram(models.Model):
@@ -113,12 +233,82 @@ class FileUploadedToTelegram(models.Model):
     binding = models.ForeignKey(to=UserTelegramBinding, on_delete=models.CASCADE)
     chat_id = models.BigIntegerField()
     message_id = models.IntegerField()
+    # pyrogram file ids embed the file reference; empty for rows
+    # uploaded before these columns existed
+    telegram_file_id = models.TextField(blank=True, default="")
+    media_type = models.CharField(max_length=16, blank=True, default="")
+    sha256 = models.CharField(max_length=64, blank=True, default="")
+
+    class Meta:
+        indexes = [models.Index(fields=["sha256", "binding"])]
+
+
+class FilePreload(models.Model):
+    class Status(models.TextChoices):
+        PENDING = "pending"
+        UPLOADING = "uploading"
+        DONE = "done"
+        FAILED = "failed"
+
+    file = models.ForeignKey(
+        to=PostFile, on_delete=models.CASCADE, related_name="preloads"
+    )
+    binding = models.ForeignKey(
+        to=UserTelegramBinding, on_delete=models.CASCADE
+    )
+    status = models.CharField(
+        max_length=16, choices=Status.choices, default=Status.PENDING
+    )
+    uploaded = models.BigIntegerField(default=0)
+    total = models.BigIntegerField(default=0)
+    error = models.TextField(blank=True, default="")
+    # parts already saved on Telegram, so a failed preload resumes
+    # instead of starting over
+    telegram_upload_id = models.BigIntegerField(null=True)
+    parts_uploaded = models.IntegerField(default=0)
+    attempts = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("file", "binding")
+
+
+class FileUpload(models.Model):
+    class Status(models.TextChoices):
+        RECEIVING = "receiving"
+        DONE = "done"
+        FAILED = "failed"
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    file = models.OneToOneField(
+        to=PostFile, on_delete=models.CASCADE, related_name="upload"
+    )
+    size = models.BigIntegerField()
+    received = models.BigIntegerField(default=0)
+    sha256 = models.CharField(max_length=64, blank=True, default="")
+    status = models.CharField(
+        max_length=16, choices=Status.choices, default=Status.RECEIVING
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
 
 class PublishedPost(models.Model):
     post = models.ForeignKey(to=Post, on_delete=models.CASCADE)
     channel = models.ForeignKey(to=Channel, on_delete=models.CASCADE)
     message_id = models.IntegerField()
+    published_at = models.DateTimeField(default=timezone.now)
+    send_lag = models.FloatField(null=True)
+    # polling schedule, see WATCH_TIERS
+    next_poll_at = models.DateTimeField(default=timezone.now)
+    frozen = models.BooleanField(default=False)
+    last_views = models.IntegerField(null=True)
+    stable_polls = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["frozen", "next_poll_at", "published_at"])
+        ]
 
 
 class WorkflowStage(models.Model):
@@ -1,180 +1,423 @@
 import logging
 import time
-from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
 
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
 from django.conf import settings
+from django.db import connection, transaction
 from django.db.models import QuerySet
 from django.utils import timezone
-from pyrogram import errors
 
+from api import stats
+from api.dispatcher import dispatcher
 from api.models import (
     PostWatch,
+    Project,
     PostMeasurement,
+    PostStats,
     Post,
     Notification,
     PublishedPost,
+    ChannelSubscriberSnapshot,
+    Channel,
+    WatchCycle,
+    FilePreload,
+    FileUpload,
 )
-from social_networks.tg import TelegramPublisher
+from social_networks.pool import client_pool
+from social_networks.tg import (
+    TelegramPublisher,
+    Priority,
+    preload_to_telegram,
+)
+
+
+@dataclass
+class WatchTier:
+    max_age: timedelta
+    interval: timedelta
+    budget: int
+
 
 scheduler = BackgroundScheduler(settings.SCHEDULER_CONFIG)
-DEFAULT_STATS = 0
-PURGE_DELTA = timedelta(days=1 << 12)  # disable purge delta
-NOTIFICATION_THRESHOLD = 3
 POST_SAFE_ZONE_DELTA = timedelta(minutes=5)
+WATCH_TIERS = [
+    WatchTier(timedelta(seconds=age), timedelta(seconds=interval), budget)
+    for age, interval, budget in settings.WATCH_TIERS
+]
+WATCH_INTERVAL = WATCH_TIERS[0].interval
+PURGE_DELTA = WATCH_TIERS[-1].max_age
+# a cycle taking this share of its interval is logged as a warning
+WATCH_OVERRUN_SHARE = 0.8
+INGEST_BATCH_SIZE = 1000
+SUBSCRIBERS_TTL = timedelta(seconds=settings.TELEGRAM_SUBSCRIBERS_TTL)
+
+
+def get_subscriber_count(publisher, channel):
+    snapshot = ChannelSubscriberSnapshot.latest(channel, SUBSCRIBERS_TTL)
+    if snapshot is None:
+        snapshot = ChannelSubscriberSnapshot.objects.create(
+            channel=channel,
+            subscribers=publisher.get_channel_subscriber_count(
+                channel.channel_id
+            ),
+        )
+    return snapshot.subscribers
+
+
+@dataclass
+class ChannelWatch:
+    channel: Channel
+    publications: list[PublishedPost]
+    # when the plan was made; polls are rescheduled from here
+    planned_at: datetime
+
+    @property
+    def message_ids(self) -> list[int]:
+        return [publication.message_id for publication in self.publications]
 
 
-def get_previous_stats(post, channel):
-    measurements = PostMeasurement.objects.filter(
-        post=post, channel=channel
-    ).order_by("created_at")
-    if not measurements.exists():
-        return DEFAULT_STATS
-    return measurements.last().views
+def get_watch_tier(age: timedelta) -> "WatchTier | None":
+    for tier in WATCH_TIERS:
+        if age < tier.max_age:
+            return tier
+    return None
 
 
-def _get_unique_watching_channels():
-    channels = {}
-    for watch in PostWatch.objects.all():
-        for channel in watch.post.target_channels.all():
-            channels[channel.channel_id] = channel
-    return channels
+def get_watch_plan(posts=None) -> dict[int, list[ChannelWatch]]:
+    """Publications to poll, grouped by binding and then by channel.
+
+    Watched publications are taken from each ``WATCH_TIERS`` age band
+    once they are due, most overdue first and at most ``budget`` of
+    them, so a plan costs one query per tier however many posts are
+    watched. ``posts`` polls all publications of those posts instead.
+    """
+    now = timezone.now()
+    publications = PublishedPost.objects.select_related(
+        "channel__binding", "post__project"
+    )
+    if posts is not None:
+        selected = list(publications.filter(post__in=posts))
+    else:
+        due = publications.filter(
+            post__in=PostWatch.objects.values("post_id"),
+            frozen=False,
+            next_poll_at__lte=now,
+        ).order_by("next_poll_at")
+        selected = []
+        newest = now
+        for tier in WATCH_TIERS:
+            oldest = now - tier.max_age
+            selected += due.filter(
+                published_at__lte=newest, published_at__gt=oldest
+            )[:tier.budget]
+            newest = oldest
+
+    plan: dict[int, dict[int, ChannelWatch]] = {}
+    selected.sort(
+        key=lambda x: (x.channel.binding_id, x.channel_id, x.message_id)
+    )
+    for publication in selected:
+        channel = publication.channel
+        watches = plan.setdefault(channel.binding_id, {})
+        if channel.id not in watches:
+            watches[channel.id] = ChannelWatch(channel, [], now)
+        watches[channel.id].publications.append(publication)
+    return {
+        binding_id: list(watches.values())
+        for binding_id, watches in plan.items()
+    }
+
+
+def _reschedule(
+    publications: list[PublishedPost], metrics: dict, planned_at: datetime
+):
+    # saved with the rest of the cycle by _ingest. Polls are due an
+    # interval after the plan, not after the poll, so slow cycles do
+    # not push every later poll back.
+    for publication in publications:
+        views = metrics[publication.message_id].views
+        tier = get_watch_tier(planned_at - publication.published_at)
+        # only the last tier freezes, younger posts still gain views
+        # between sparse polls
+        if tier is WATCH_TIERS[-1] and views == publication.last_views:
+            publication.stable_polls += 1
+        else:
+            publication.stable_polls = 0
+        publication.last_views = views
+
+        publication.frozen = tier is None or (
+            settings.WATCH_FREEZE_AFTER is not None
+            and publication.stable_polls >= settings.WATCH_FREEZE_AFTER
+        )
+        if tier is not None:
+            publication.next_poll_at = planned_at + tier.interval
 
 
 def _purge_old_watches():
     now = timezone.now()
-    for watch in PostWatch.objects.filter(created_at__lt=now - PURGE_DELTA):
-        watch.delete()
+    PostWatch.objects.filter(created_at__lt=now - PURGE_DELTA).delete()
 
 
 def watch_job():
     _purge_old_watches()
-    channels = _get_unique_watching_channels()
-    _watch_channels(channels)
+    started_at = timezone.now()
+    started = time.monotonic()
+    plan = get_watch_plan()
+    batch = _watch_channels(plan)
+    ingest = _ingest(batch)
+    duration = time.monotonic() - started
+
+    cycle = WatchCycle.objects.create(
+        started_at=started_at,
+        duration=duration,
+        bindings=len(plan),
+        channels=sum(len(watches) for watches in plan.values()),
+        publications=sum(
+            len(watch.publications)
+            for watches in plan.values()
+            for watch in watches
+        ),
+        failed_channels=batch.failed_channels,
+        measurements=ingest.measurements,
+        notifications=ingest.notifications,
+        write_duration=ingest.duration,
+    )
+    interval = WATCH_INTERVAL.total_seconds()
+    log = (
+        logging.warning
+        if duration > interval * WATCH_OVERRUN_SHARE
+        else logging.info
+    )
+    log(
+        f"Watch cycle took {duration:.1f}s of {interval:.0f}s: "
+        f"{cycle.channels} channels of {cycle.bindings} bindings, "
+        f"{cycle.failed_channels} failed; wrote {cycle.measurements} "
+        f"measurements and {cycle.notifications} notifications "
+        f"in {cycle.write_duration:.2f}s"
+    )
 
 
-def _watch_channels(channels):
-    for channel_id, channel in channels.items():
-        publications = list(PublishedPost.objects.filter(channel=channel))
-        message_ids = list(map(lambda x: x.message_id, publications))
-        _watch_channel(channel, channel_id, message_ids, publications)
+@dataclass
+class WatchBatch:
+    """Results of polling, written to the database by ``_ingest``."""
+
+    measurements: list[PostMeasurement] = field(default_factory=list)
+    publications: list[PublishedPost] = field(default_factory=list)
+    failed_channels: int = 0
+
+    def extend(self, other: "WatchBatch"):
+        self.measurements += other.measurements
+        self.publications += other.publications
+        self.failed_channels += other.failed_channels
+
+
+@dataclass
+class IngestResult:
+    measurements: int = 0
+    notifications: int = 0
+    duration: float = 0.0
+
+
+def _watch_channels(plan: dict[int, list[ChannelWatch]]) -> WatchBatch:
+    """Poll every binding of the plan, several bindings at a time.
+
+    Each binding is served by one publisher session for all of its
+    channels. Nothing is written here; the collected batch is saved at
+    once by ``_ingest``.
+    """
+    batch = WatchBatch()
+    if not plan:
+        return batch
+    with ThreadPoolExecutor(
+        max_workers=min(settings.WATCH_MAX_WORKERS, len(plan)),
+        thread_name_prefix="watch",
+    ) as executor:
+        for result in executor.map(_watch_binding, plan.values()):
+            batch.extend(result)
+    return batch
+
+
+def _watch_binding(watches: list[ChannelWatch]) -> WatchBatch:
+    batch = WatchBatch()
+    binding = watches[0].channel.binding
+    try:
+        with TelegramPublisher(
+            binding, priority=Priority.BACKGROUND
+        ) as publisher:
+            for watch in watches:
+                try:
+                    batch.measurements += _watch_channel(publisher, watch)
+                    batch.publications += watch.publications
+                except Exception:
+                    logging.exception(
+                        f"Failed to watch channel {watch.channel.channel_id}"
+                    )
+                    batch.failed_channels += 1
+    except Exception:
+        logging.exception(f"Failed to watch binding {binding.id}")
+        batch.failed_channels = len(watches)
+    finally:
+        connection.close()
+    return batch
 
 
 def force_watch_for_post(post):
     _purge_old_watches()
-    _watch_channels({channel.channel_id: channel
-                     for channel in post.target_channels.all()})
-
-
-def _watch_channel(channel, channel_id, message_ids, publications):
-    with TelegramPublisher(channel.binding.session_string) as publisher:
-        ers, reactions = publisher.get_engagement_rates(channel_id, message_ids)
-        views = publisher.get_views_count(channel_id, message_ids)
-        for publication in publications:
-            _watch_publication(
-                channel,
-                publication,
-                views[publication.message_id],
-                ers[publication.message_id],
-                reactions[publication.message_id],
+    _ingest(_watch_channels(get_watch_plan(posts=[post])))
+
+
+def _watch_channel(publisher, watch: ChannelWatch) -> list[PostMeasurement]:
+    channel = watch.channel
+    subscribers = get_subscriber_count(publisher, channel)
+    metrics = publisher.collect_metrics(channel.channel_id, watch.message_ids)
+    measurements = []
+    for publication in watch.publications:
+        record = metrics[publication.message_id]
+        measurements.append(
+            PostMeasurement(
+                post=publication.post,
+                channel=channel,
+                views=record.views,
+                engagement_rate=record.engagement_rate(subscribers),
+                reactions=record.reactions,
             )
+        )
+    _reschedule(watch.publications, metrics, watch.planned_at)
+    return measurements
+
+
+def _ingest(batch: WatchBatch) -> IngestResult:
+    """Write a polled batch in one transaction, a few statements per table."""
+    started = time.monotonic()
+    with transaction.atomic():
+        PostMeasurement.objects.bulk_create(
+            batch.measurements, batch_size=INGEST_BATCH_SIZE
+        )
+        notifications = _update_stats(batch.measurements)
+        Notification.objects.bulk_create(
+            notifications, batch_size=INGEST_BATCH_SIZE
+        )
+        PublishedPost.objects.bulk_update(
+            batch.publications,
+            ["next_poll_at", "frozen", "last_views", "stable_polls"],
+            batch_size=INGEST_BATCH_SIZE,
+        )
+    return IngestResult(
+        measurements=len(batch.measurements),
+        notifications=len(notifications),
+        duration=time.monotonic() - started,
+    )
+
+
+def _update_stats(measurements: list[PostMeasurement]) -> list[Notification]:
+    """Move ``PostStats`` to the new measurements.
+
+    Returns notifications for the posts that crossed the
+    ``notify_at_views`` of their channel.
+    """
+    latest = {(x.post_id, x.channel_id): x for x in measurements}
+    if not latest:
+        return []
+    previous = {
+        (stats.post_id, stats.channel_id): stats.views
+        for stats in PostStats.objects.select_for_update().filter(
+            post_id__in={post_id for post_id, _ in latest},
+            channel_id__in={channel_id for _, channel_id in latest},
+        )
+    }
+    PostStats.objects.bulk_create(
+        [
+            PostStats(
+                post_id=x.post_id,
+                channel_id=x.channel_id,
+                views=x.views,
+                engagement_rate=x.engagement_rate,
+                reactions=x.reactions,
+            )
+            for x in latest.values()
+        ],
+        batch_size=INGEST_BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=["post", "channel"],
+        update_fields=["views", "engagement_rate", "reactions", "updated_at"],
+    )
+
+    crossed = [
+        x
+        for key, x in latest.items()
+        if previous.get(key, 0) < x.channel.notify_at_views <= x.views
+    ]
+    if not crossed:
+        return []
+    participants: dict[int, list[int]] = {}
+    for project_id, user_id in Project.participants.through.objects.filter(
+        project_id__in={x.post.project_id for x in crossed}
+    ).values_list("project_id", "user_id"):
+        participants.setdefault(project_id, []).append(user_id)
+    return [
+        Notification(
+            user_id=user_id,
+            text=f"Your post {x.post.name} gained "
+            f"{x.views} on channel "
+            f"{x.channel.name}",
+        )
+        for x in crossed
+        for user_id in participants.get(x.post.project_id, [])
+    ]
+
+
+def compact_stats_job():
+    started = time.monotonic()
+    compacted = stats.compact()
+    logging.info(
+        f"Compacted post statistics in {time.monotonic() - started:.1f}s: "
+        + ", ".join(f"{count} {name}" for name, count in compacted.items())
+    )
 
 
-def _watch_publication(channel, publication, views, er, reactions):
-    measurement = PostMeasurement(
-        post=publication.post,
-        views=views,
-        engagement_rate=er,
-        channel=channel,
-        reactions=reactions,
+def retry_preloads_job():
+    retry_before = timezone.now() - timedelta(
+        seconds=settings.TELEGRAM_PRELOAD_RETRY_DELAY
     )
-    measurement.save()
-    previous_value = get_previous_stats(publication.post, channel)
-    if (
-        previous_value
-        < NOTIFICATION_THRESHOLD
-        <= views
-    ):
-        Notification.notify_users(
-            publication.post.project.participants,
-            f"Your post {publication.post.name} gained "
-            f"{views} on channel "
-            f"{channel.name}",
+    failed = (
+        FilePreload.objects.filter(
+            status=FilePreload.Status.FAILED,
+            attempts__lt=settings.TELEGRAM_PRELOAD_MAX_ATTEMPTS,
+            updated_at__lt=retry_before,
         )
+        # finish_upload restarts those that gave up on a stalled upload
+        .exclude(file__upload__status=FileUpload.Status.RECEIVING)
+        .select_related("file__post")
+    )
+    files = {preload.file_id: preload.file for preload in failed}
+    if files:
+        logging.info(f"Retrying failed preloads of {len(files)} files")
+        preload_to_telegram(list(files.values()))
+
+
+def evict_idle_clients_job():
+    client_pool.evict_idle()
 
 
 def job_send_post(post_id):
-    post = Post.objects.get(id=post_id)
-    sessions = {}
-    for channel in post.target_channels.all():
-        key = channel.binding.session_string
-        sessions.setdefault(key, [])
-        sessions[key].append(channel)
-
-    sent_count = 0
-
-    logging.warning(f"Initializing clients for {post_id} post")
-
-    clients = {}
-    for session_string in sessions.keys():
-        clients[session_string] = TelegramPublisher(session_string)
-        clients[session_string].start()
-
-    delta = (post.schedule_time - timezone.now()).total_seconds() - 1
-    logging.warning(f"Waiting for {delta} seconds from {timezone.now().isoformat()}")
-    time.sleep(max(0, delta))
-
-    for session_string, channels in sessions.items():
-        publisher = clients[session_string]
-        for channel in channels:
-            logging.warning(f"Sending {post.id} to {channel.channel_id}")
-            try:
-                message_id = publisher.publish(
-                    channel.channel_id,
-                    post,
-                ).id
-                logging.info(f"Sent {post.id}")
-            except errors.RPCError as e:
-                logging.exception("Failed to sent post")
-            else:
-                sent_count += 1
-                publication = PublishedPost(
-                    post=post,
-                    channel=channel,
-                    message_id=message_id,
-                )
-                publication.save()
-                post_watch = PostWatch(post=post)
-                post_watch.save()
-                time.sleep(0.1)
-
-    post.is_sent = True
-    post.save()
-
-    for client in clients.values():
-        client.stop()
+    dispatcher.send_now(post_id)
 
 
 def schedule_sending(post_id):
     post = Post.objects.get(id=post_id)
-    run_date = post.schedule_time - timedelta(seconds=20)
-    if run_date < timezone.now():
-        run_date = timezone.now() + timedelta(seconds=1)
-    scheduler.add_job(
-        job_send_post,
-        run_date=run_date,
-        args=(post_id,),
-        id=f"send_post_{post_id}_job",
-        max_instances=1,
-        replace_existing=True,
-    )
+    dispatcher.schedule(post.id, post.schedule_time)
 
 
 def unschedule_sending(post_id):
-    for job in scheduler.get_jobs():
-        if job.name == f"send_post_{post_id}_job":
-            scheduler.remove_job(job.id)
+    dispatcher.cancel(post_id)
+
+
+def sync_dispatcher_job():
+    dispatcher.sync()
 
 
 def is_another_post_scheduled_in_channel_at_that_time(channel,
@@ -211,10 +454,49 @@ def start():
 
     scheduler.add_job(
         watch_job,
-        trigger=CronTrigger(minute="*/5"),
+        trigger=CronTrigger(
+            minute=f"*/{int(WATCH_INTERVAL.total_seconds() // 60)}"
+        ),
         id="watch_job",
         max_instances=1,
         replace_existing=True,
     )
+    scheduler.add_job(
+        compact_stats_job,
+        trigger=CronTrigger(minute="7"),
+        id="compact_stats_job",
+        max_instances=1,
+        replace_existing=True,
+    )
+    scheduler.add_job(
+        evict_idle_clients_job,
+        trigger=CronTrigger(minute="*"),
+        id="evict_idle_clients_job",
+        max_instances=1,
+        replace_existing=True,
+    )
+    scheduler.add_job(
+        retry_preloads_job,
+        trigger=CronTrigger(minute="*"),
+        id="retry_preloads_job",
+        max_instances=1,
+        replace_existing=True,
+    )
+    scheduler.add_job(
+        sync_dispatcher_job,
+        trigger=CronTrigger(minute="*"),
+        id="sync_dispatcher_job",
+        max_instances=1,
+        replace_existing=True,
+    )
+
+    scheduler.start(paused=True)
+    # posts used to be sent by one stored job each, the dispatcher
+    # sends them now
+    for job in scheduler.get_jobs():
+        if job.id.startswith("send_post_"):
+            job.remove()
+    scheduler.resume()
 
-    scheduler.start()
+    dispatcher.sync()
+    dispatcher.start()
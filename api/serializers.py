@@ -2,13 +2,15 @@ import logging
 from datetime import datetime
 from threading import Thread
 from typing import Any, Dict
+from django.core.files.base import ContentFile
 from rest_framework import serializers
 from rest_framework.fields import empty
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
 from social_networks.tg import preload_to_telegram
 from . import models
-from .models import PostFile
+from .models import PostFile, FileUpload
+from .uploads import find_stored, save_by_content, file_sha256
 from .scheduler import scheduler
 
 
@@ -35,7 +37,23 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
         return data
 
 
+class FilePreloadSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = models.FilePreload
+        fields = [
+            "binding",
+            "status",
+            "uploaded",
+            "total",
+            "error",
+            "updated_at",
+        ]
+        read_only_fields = fields
+
+
 class PostFileSerializer(serializers.ModelSerializer):
+    preloads = FilePreloadSerializer(many=True, read_only=True)
+
     class Meta:
         model = models.PostFile
         fields = "__all__"
@@ -62,8 +80,13 @@ class FileListSerializer(serializers.Serializer):
         files = validated_data.pop("files")
         post_files = []
         for file in files:
+            sha256 = getattr(file, "sha256", None) or file_sha256(file)
             post_file = PostFile(
-                post=self.post, file=file, is_video_note=self.is_video_note
+                post=self.post,
+                file=save_by_content(file, sha256),
+                name=file.name,
+                sha256=sha256,
+                is_video_note=self.is_video_note,
             )
             post_file.save()
             post_files.append(post_file)
@@ -73,6 +96,75 @@ class FileListSerializer(serializers.Serializer):
         return post_file
 
 
+class FileUploadSerializer(serializers.ModelSerializer):
+    preloads = FilePreloadSerializer(
+        source="file.preloads", many=True, read_only=True
+    )
+
+    class Meta:
+        model = models.FileUpload
+        fields = [
+            "id",
+            "file",
+            "size",
+            "received",
+            "sha256",
+            "status",
+            "preloads",
+            "created_at",
+            "updated_at",
+        ]
+        read_only_fields = fields
+
+
+class FileUploadCreateSerializer(serializers.Serializer):
+    filename = serializers.CharField(max_length=255)
+    size = serializers.IntegerField(min_value=1)
+    sha256 = serializers.RegexField(
+        r"^[0-9a-fA-F]{64}$", required=False, default=""
+    )
+    is_video_note = serializers.BooleanField(default=False)
+
+    def __init__(self, instance=None, data=empty, post=None, **kwargs):
+        self.post = post
+        super().__init__(instance, data, **kwargs)
+
+    def create(self, validated_data):
+        sha256 = validated_data["sha256"].lower()
+        size = validated_data["size"]
+        post_file = PostFile(
+            post=self.post,
+            name=validated_data["filename"],
+            is_video_note=validated_data["is_video_note"],
+        )
+        stored = (
+            find_stored(sha256, size, self.post.project) if sha256 else None
+        )
+        if stored is not None:
+            # known content needs no chunks at all
+            post_file.file = stored.file.name
+            post_file.sha256 = sha256
+            post_file.save()
+            upload = FileUpload.objects.create(
+                file=post_file,
+                size=size,
+                received=size,
+                sha256=sha256,
+                status=FileUpload.Status.DONE,
+            )
+        else:
+            post_file.file.save(
+                validated_data["filename"], ContentFile(b""), save=True
+            )
+            upload = FileUpload.objects.create(
+                file=post_file, size=size, sha256=sha256
+            )
+
+        # the preload streams parts as chunks arrive
+        Thread(target=preload_to_telegram, args=([post_file],)).start()
+        return upload
+
+
 class PostSerializer(serializers.ModelSerializer):
     files = PostFileSerializer(many=True, read_only=True)
 
@@ -87,8 +179,10 @@ class PostSerializer(serializers.ModelSerializer):
             "target_channels",
             "files",
             "is_sent",
+            "send_lag",
             "stage"
         ]
+        read_only_fields = ["send_lag"]
 
 
 class ChannelSerializer(serializers.ModelSerializer):
@@ -130,7 +224,12 @@ class ProjectSerializer(serializers.ModelSerializer):
 class BindingSerializer(serializers.ModelSerializer):
     class Meta:
         model = models.UserTelegramBinding
-        fields = ["id", "account_id", "name"]
+        fields = ["id", "account_id", "name", "channels_diff"]
+        read_only_fields = ["channels_diff"]
+
+
+class ChannelsReloadSerializer(serializers.Serializer):
+    full = serializers.BooleanField(default=False)
 
 
 class NotificationSerializer(serializers.ModelSerializer):
@@ -155,6 +254,34 @@ class PostMeasurementSerializer(serializers.ModelSerializer):
         read_only_fields = fields
 
 
+class PostMeasurementRollupSerializer(serializers.ModelSerializer):
+    channel = ChannelSerializer(read_only=True)
+    created_at = serializers.DateTimeField(source="bucket")
+    views = serializers.IntegerField(source="views_last")
+    engagement_rate = serializers.FloatField(source="engagement_rate_last")
+    reactions = serializers.IntegerField(source="reactions_last")
+
+    class Meta:
+        model = models.PostMeasurementRollup
+        fields = [
+            "post",
+            "channel",
+            "created_at",
+            "views",
+            "engagement_rate",
+            "reactions",
+            "resolution",
+            "samples",
+            "views_min",
+            "views_max",
+            "engagement_rate_min",
+            "engagement_rate_max",
+            "reactions_min",
+            "reactions_max",
+        ]
+        read_only_fields = fields
+
+
 class WorkflowStageSerializer(serializers.ModelSerializer):
     class Meta:
         model = models.WorkflowStage
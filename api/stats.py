@@ -0,0 +1,249 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from api.models import Channel, PostMeasurement, PostMeasurementRollup
+
+RAW = "raw"
+HOUR = PostMeasurementRollup.Resolution.HOUR
+DAY = PostMeasurementRollup.Resolution.DAY
+# finest first, each one is compacted into the next
+RESOLUTIONS = [RAW, HOUR, DAY]
+BUCKETS = {HOUR: timedelta(hours=1), DAY: timedelta(days=1)}
+METRICS = ("views", "engagement_rate", "reactions")
+ROLLUP_FIELDS = [
+    f"{metric}_{kind}" for metric in METRICS for kind in ("min", "max", "last")
+]
+COMPACT_BATCH_SIZE = 5000
+# bucket sizes clients can resample series to
+SERIES_BUCKETS = {
+    "5m": timedelta(minutes=5),
+    "1h": timedelta(hours=1),
+    "1d": timedelta(days=1),
+}
+
+
+def get_retention(resolution: str) -> "timedelta | None":
+    seconds = settings.STATS_RETENTION.get(resolution)
+    return None if seconds is None else timedelta(seconds=seconds)
+
+
+def truncate(moment: datetime, width: timedelta) -> datetime:
+    # buckets are aligned to the epoch, so days start at midnight UTC
+    step = width.total_seconds()
+    return datetime.fromtimestamp(
+        moment.timestamp() // step * step, tz=dt_timezone.utc
+    )
+
+
+def pick_resolution(since: "datetime | None") -> str:
+    """Finest resolution that still holds everything after ``since``."""
+    window = None if since is None else timezone.now() - since
+    for resolution in RESOLUTIONS:
+        retention = get_retention(resolution)
+        if retention is None or (window is not None and window <= retention):
+            return resolution
+    return RESOLUTIONS[-1]
+
+
+def _rows(resolution: str):
+    if resolution == RAW:
+        return PostMeasurement.objects.all()
+    return PostMeasurementRollup.objects.filter(resolution=resolution)
+
+
+def _time_field(resolution: str) -> str:
+    return "created_at" if resolution == RAW else "bucket"
+
+
+def _sample_time(row) -> datetime:
+    if isinstance(row, PostMeasurement):
+        return row.created_at
+    return row.bucket
+
+
+def _as_rollup(row, resolution: "str | None", bucket: datetime):
+    if isinstance(row, PostMeasurement):
+        samples = 1
+        values = {
+            name: getattr(row, name.rsplit("_", 1)[0])
+            for name in ROLLUP_FIELDS
+        }
+    else:
+        samples = row.samples
+        values = {name: getattr(row, name) for name in ROLLUP_FIELDS}
+    return PostMeasurementRollup(
+        post_id=row.post_id,
+        channel_id=row.channel_id,
+        resolution=resolution,
+        bucket=bucket,
+        samples=samples,
+        **values,
+    )
+
+
+def _merge(into: PostMeasurementRollup, later: PostMeasurementRollup):
+    into.samples += later.samples
+    for metric in METRICS:
+        low, high = f"{metric}_min", f"{metric}_max"
+        setattr(into, low, min(getattr(into, low), getattr(later, low)))
+        setattr(into, high, max(getattr(into, high), getattr(later, high)))
+        setattr(into, f"{metric}_last", getattr(later, f"{metric}_last"))
+
+
+def aggregate(
+    rows, width: timedelta, resolution: "str | None" = None
+) -> dict[tuple, PostMeasurementRollup]:
+    """Fold measurements or finer rollups, oldest first, into buckets.
+
+    Returns unsaved rollups keyed by (post id, channel id, bucket).
+    """
+    rollups = {}
+    for row in rows:
+        bucket = truncate(_sample_time(row), width)
+        key = (row.post_id, row.channel_id, bucket)
+        if key in rollups:
+            _merge(rollups[key], _as_rollup(row, resolution, bucket))
+        else:
+            rollups[key] = _as_rollup(row, resolution, bucket)
+    return rollups
+
+
+def compact(now: "datetime | None" = None) -> dict[str, int]:
+    """Apply ``STATS_RETENTION``.
+
+    Statistics past the retention of their resolution are rolled up into
+    the next one, or dropped at the coarsest. Returns the number of rows
+    compacted per resolution.
+    """
+    now = now or timezone.now()
+    compacted = {}
+    targets = RESOLUTIONS[1:] + [None]
+    for source, target in zip(RESOLUTIONS, targets):
+        retention = get_retention(source)
+        if retention is None:
+            continue
+        if target is None:
+            expired = _rows(source).filter(
+                **{f"{_time_field(source)}__lt": now - retention}
+            )
+            compacted[source] = expired.delete()[0]
+            continue
+        cutoff = truncate(now - retention, BUCKETS[target])
+        compacted[source] = _compact(
+            _rows(source).filter(**{f"{_time_field(source)}__lt": cutoff}),
+            _time_field(source),
+            target,
+        )
+    return compacted
+
+
+def _compact(rows, time_field: str, resolution: str) -> int:
+    compacted = 0
+    while True:
+        with transaction.atomic():
+            batch = list(rows.order_by(time_field, "id")[:COMPACT_BATCH_SIZE])
+            if not batch:
+                return compacted
+            rollups = aggregate(batch, BUCKETS[resolution], resolution)
+            # buckets cut by the batch boundary continue a stored rollup
+            stored = PostMeasurementRollup.objects.filter(
+                resolution=resolution,
+                bucket__in={bucket for _, _, bucket in rollups},
+                post_id__in={post_id for post_id, _, _ in rollups},
+                channel_id__in={channel_id for _, channel_id, _ in rollups},
+            )
+            for rollup in stored:
+                key = (rollup.post_id, rollup.channel_id, rollup.bucket)
+                if key in rollups:
+                    merged = _as_rollup(rollup, resolution, rollup.bucket)
+                    _merge(merged, rollups[key])
+                    rollups[key] = merged
+            PostMeasurementRollup.objects.bulk_create(
+                rollups.values(),
+                update_conflicts=True,
+                unique_fields=["post", "channel", "resolution", "bucket"],
+                update_fields=["samples", *ROLLUP_FIELDS],
+            )
+            rows.model.objects.filter(
+                id__in=[row.id for row in batch]
+            ).delete()
+        compacted += len(batch)
+
+
+def get_series(post_id: int, since: "datetime | None", resolution: str):
+    """Statistics of a post after ``since`` at ``resolution``.
+
+    Raw resolution returns the measurements themselves. Coarser ones
+    return rollups ordered by bucket; the part of the window that is
+    not compacted yet is aggregated from finer data on the fly.
+    """
+    if resolution == RAW:
+        rows = PostMeasurement.objects.filter(post_id=post_id)
+        if since is not None:
+            rows = rows.filter(created_at__gte=since)
+        return list(rows.select_related("channel").order_by("created_at"))
+
+    rollups = aggregate(
+        _samples(post_id, since, BUCKETS[resolution], resolution),
+        BUCKETS[resolution],
+        resolution,
+    )
+    channels = Channel.objects.in_bulk(
+        {x.channel_id for x in rollups.values()}
+    )
+    for rollup in rollups.values():
+        rollup.channel = channels[rollup.channel_id]
+    return sorted(rollups.values(), key=lambda x: x.bucket)
+
+
+def resample(post_id: int, since: "datetime | None", width: timedelta):
+    """Statistics of a post after ``since`` in buckets of ``width``.
+
+    Every resolution is read, so where only coarser rollups are left the
+    series gets sparser instead of stopping. Returns the bucket start
+    times and, per channel id, the last views, engagement rate and
+    reactions of each bucket; buckets without samples are None.
+    """
+    rollups = aggregate(_samples(post_id, since, width), width)
+    timestamps = sorted({bucket for _, _, bucket in rollups})
+    positions = {bucket: i for i, bucket in enumerate(timestamps)}
+    columns: dict[int, dict[str, list]] = {}
+    for (_, channel_id, bucket), rollup in rollups.items():
+        if channel_id not in columns:
+            columns[channel_id] = {
+                metric: [None] * len(timestamps) for metric in METRICS
+            }
+        for metric in METRICS:
+            columns[channel_id][metric][positions[bucket]] = getattr(
+                rollup, f"{metric}_last"
+            )
+    return timestamps, columns
+
+
+def _samples(
+    post_id: int,
+    since: "datetime | None",
+    width: timedelta,
+    resolution: "str | None" = None,
+) -> list:
+    # every stored resolution up to ``resolution``, oldest sample first
+    if since is not None:
+        since = truncate(since, width)
+    sources = (
+        RESOLUTIONS
+        if resolution is None
+        else RESOLUTIONS[: RESOLUTIONS.index(resolution) + 1]
+    )
+    rows = []
+    for source in sources:
+        time_field = _time_field(source)
+        source_rows = _rows(source).filter(post_id=post_id)
+        if since is not None:
+            source_rows = source_rows.filter(**{f"{time_field}__gte": since})
+        rows += source_rows.order_by(time_field, "id")
+    # sources never overlap in time, compaction cuts on bucket bounds
+    rows.sort(key=_sample_time)
+    return rows
@@ -1,3 +1,155 @@
-from django.test import TestCase
+import time
+from datetime import timedelta
+from unittest.mock import Mock, patch
 
-# Create your tests here.
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from api.dispatcher import PublishDispatcher, _BindingSend, _Dispatch
+from api.models import (
+    Channel,
+    Post,
+    Project,
+    PublishedPost,
+    User,
+    UserTelegramBinding,
+)
+
+
+class PublishDispatcherTests(TestCase):
+    def setUp(self):
+        owner = User.objects.create(username="owner")
+        project = Project.objects.create(name="project", owner=owner)
+        self.post = Post.objects.create(
+            project=project,
+            name="post",
+            text="text",
+            schedule_time=timezone.now() + timedelta(minutes=1),
+        )
+        self.dispatcher = PublishDispatcher(
+            prewarm=0, max_workers=1, misfire_grace=60
+        )
+        self.dispatcher._sending.add(self.post.id)
+
+    def tearDown(self):
+        self.dispatcher._workers.shutdown()
+
+    def test_sync_skips_post_finished_during_query(self):
+        # the query still sees the post unsent, then its send finishes
+        # before sync compares the rows with the dispatcher state
+        dispatcher = self.dispatcher
+        query = Post.objects.filter
+
+        def finish_after_query(*args, **kwargs):
+            rows = list(
+                query(*args, **kwargs).values_list("id", "schedule_time")
+            )
+            dispatcher._finish(_Dispatch(self.post, []))
+            return Mock(values_list=Mock(return_value=rows))
+
+        with patch.object(
+            Post.objects, "filter", side_effect=finish_after_query
+        ):
+            dispatcher.sync()
+
+        self.assertNotIn(self.post.id, dispatcher._scheduled)
+        self.assertNotIn(self.post.id, dispatcher._sending)
+
+    def test_prepare_skips_sent_post(self):
+        Post.objects.filter(id=self.post.id).update(is_sent=True)
+        # closing the connection would end the test transaction
+        with patch("api.dispatcher.connection"), patch(
+            "api.dispatcher.TelegramPublisher"
+        ) as publisher:
+            self.assertIsNone(self.dispatcher._prepare(self.post.id))
+        publisher.assert_not_called()
+
+    def test_rescheduling_releases_prepared_dispatch(self):
+        dispatcher = self.dispatcher
+        # the prewarm slots are due right away, the sends are not
+        dispatcher.prewarm = 2 * 60 * 60
+        publishers = []
+
+        def prepare(post_id):
+            send = _BindingSend(Mock(), [])
+            publishers.append(send.publisher)
+            return _Dispatch(self.post, [send])
+
+        slot = timezone.now() + timedelta(hours=1)
+        with patch.object(dispatcher, "_prepare", side_effect=prepare):
+            dispatcher.start()
+            try:
+                dispatcher.schedule(self.post.id, slot)
+                # a PATCH with an unchanged schedule_time
+                dispatcher.schedule(self.post.id, slot)
+                wait_until(lambda: len(publishers) == 1)
+                dispatcher.schedule(self.post.id, slot + timedelta(minutes=1))
+                wait_until(lambda: len(publishers) == 2)
+            finally:
+                dispatcher.stop()
+
+        self.assertEqual(len(publishers), 2)
+        wait_until(lambda: publishers[0].stop.called)
+        publishers[1].stop.assert_not_called()
+
+
+class PublishDispatcherSendTests(TransactionTestCase):
+    # the sends run on worker threads, which need committed rows
+
+    def setUp(self):
+        owner = User.objects.create(username="owner")
+        project = Project.objects.create(name="project", owner=owner)
+        binding = UserTelegramBinding.objects.create(
+            account_id=1, name="binding", session_string="", owner=owner
+        )
+        self.channels = [
+            Channel.objects.create(
+                project=project,
+                type="telegram",
+                is_group=False,
+                name=f"channel {channel_id}",
+                channel_id=channel_id,
+                binding=binding,
+            )
+            for channel_id in ("1", "2")
+        ]
+        self.post = Post.objects.create(
+            project=project, name="post", text="text"
+        )
+        self.post.target_channels.set(self.channels)
+        self.dispatcher = PublishDispatcher(
+            prewarm=0, max_workers=2, misfire_grace=60
+        )
+
+    def tearDown(self):
+        self.dispatcher._workers.shutdown()
+
+    def test_failed_send_leaves_post_unsent_for_retry(self):
+        with patch("api.dispatcher.TelegramPublisher") as publisher:
+            publish = publisher.return_value.publish
+            publish.side_effect = [ConnectionError("reset"), Mock(id=10)]
+            self.dispatcher.send_now(self.post.id)
+
+            self.post.refresh_from_db()
+            self.assertFalse(self.post.is_sent)
+            self.assertEqual(PublishedPost.objects.count(), 1)
+            self.assertNotIn(self.post.id, self.dispatcher._sending)
+
+            # the retry only sends to the channel that failed
+            publish.side_effect = [Mock(id=11)]
+            self.dispatcher.send_now(self.post.id)
+
+        self.post.refresh_from_db()
+        self.assertTrue(self.post.is_sent)
+        self.assertEqual(
+            publish.call_args_list[-1].args[0], self.channels[0].channel_id
+        )
+        self.assertEqual(PublishedPost.objects.count(), 2)
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not met in time")
+        time.sleep(0.01)
@@ -0,0 +1,102 @@
+import hashlib
+import os
+
+from django.core.files.storage import default_storage
+from django.core.files.uploadhandler import (
+    MemoryFileUploadHandler,
+    TemporaryFileUploadHandler,
+)
+
+from api.models import PostFile, FileUploadedToTelegram
+
+
+class HashingUploadMixin:
+    """Sets ``sha256`` on uploaded files while Django receives them."""
+
+    def new_file(self, *args, **kwargs):
+        # the memory handler stops other handlers by raising from here
+        self.digest = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        self.digest.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.sha256 = self.digest.hexdigest()
+        return file
+
+
+class HashingMemoryFileUploadHandler(
+    HashingUploadMixin, MemoryFileUploadHandler
+):
+    pass
+
+
+class HashingTemporaryFileUploadHandler(
+    HashingUploadMixin, TemporaryFileUploadHandler
+):
+    pass
+
+
+def file_sha256(file) -> str:
+    digest = hashlib.sha256()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def content_name(sha256: str, filename: str) -> str:
+    # the extension stays, media types are guessed from it
+    extension = os.path.splitext(filename)[1].lower()
+    return f"files/sha256/{sha256[:2]}/{sha256}{extension}"
+
+
+def find_stored(sha256: str, size: int, project) -> "PostFile | None":
+    """A stored file with this content from a project of the same owner.
+
+    Only the client's word vouches for the hash, so content is never
+    shared across owners.
+    """
+    files = PostFile.objects.filter(
+        sha256=sha256, post__project__owner_id=project.owner_id
+    ).exclude(file="")
+    for post_file in files:
+        if (
+            default_storage.exists(post_file.file.name)
+            and post_file.file.size == size
+        ):
+            return post_file
+    return None
+
+
+def save_by_content(file, sha256: str) -> str:
+    """Store an uploaded file under its content address, once."""
+    name = content_name(sha256, file.name)
+    if default_storage.exists(name):
+        return name
+    return default_storage.save(name, file)
+
+
+def move_by_content(post_file: PostFile, sha256: str):
+    """Move a file assembled from chunks to its content address.
+
+    When the content is already stored, the assembled copy is dropped.
+    Streaming preloads keep their open handle, so they are unaffected.
+    """
+    name = content_name(sha256, post_file.name or post_file.file.name)
+    current = post_file.file.path
+    if default_storage.exists(name):
+        os.remove(current)
+    else:
+        path = default_storage.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(current, path)
+
+    post_file.file.name = name
+    post_file.sha256 = sha256
+    post_file.save(update_fields=["file", "sha256"])
+    FileUploadedToTelegram.objects.filter(file=post_file).update(sha256=sha256)
@@ -35,6 +35,14 @@ urlpatterns = [
         "projects/<int:project>/posts/<int:post_id>/files/upload/",
         views.posts.UploadFilesView.as_view(),
     ),
+    path(
+        "projects/<int:project>/posts/<int:post_id>/files/uploads/",
+        views.posts.FileUploadCreateView.as_view(),
+    ),
+    path(
+        "projects/<int:project>/posts/<int:post_id>/files/uploads/<uuid:pk>/",
+        views.posts.FileUploadView.as_view(),
+    ),
     path(
         "projects/<int:project>/posts/<int:post_id>/files/",
         views.posts.PostFileListAPIView.as_view(),
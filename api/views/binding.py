@@ -1,3 +1,4 @@
+import logging
 from datetime import datetime
 from threading import Thread
 
@@ -12,8 +13,14 @@ from rest_framework.views import APIView
 from api.models import UserTelegramBinding
 from api.permissions import IsOwner
 from api.scheduler import scheduler
-from api.serializers import BindingSerializer
-from social_networks.tg import TelegramAuthorizer, TelegramPublisher
+from api.serializers import BindingSerializer, ChannelsReloadSerializer
+from social_networks.tg import (
+    TelegramAuthorizer,
+    TelegramPublisher,
+    Priority,
+    LoginError,
+    TooManyLogins,
+)
 
 
 class BindingSendCodeView(APIView):
@@ -27,6 +34,8 @@ class BindingSendCodeView(APIView):
             auth_id = TelegramAuthorizer().send_code(
                 request.data["phone"], test_mode=test_mode
             )
+        except TooManyLogins as e:
+            return Response({"error": str(e)}, 429)
         except RPCError as e:
             return Response({"error": str(e)}, 400)
         return Response({"auth_id": auth_id}, 200)
@@ -58,7 +67,7 @@ class BindingEnterCodeView(APIView):
                 return Response(
                     {"status": "need_password", "auth_id": result.auth_id}, 200
                 )
-        except RPCError as e:
+        except (RPCError, LoginError) as e:
             return Response({"error": str(e)}, 400)
 
 
@@ -83,7 +92,7 @@ class BindingEnterPasswordView(APIView):
             binding.save()
             Thread(target=fetch_channels, args=(binding,)).start()
             return Response({"status": "ok"}, 200)
-        except RPCError as e:
+        except (RPCError, LoginError) as e:
             return Response({"error": str(e)}, 400)
 
 
@@ -117,22 +126,64 @@ class BindingsChannelsReloadView(APIView):
     permission_classes = (IsAuthenticated,)
 
     def post(self, request, *args, **kwargs):
+        serializer = ChannelsReloadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        full = serializer.validated_data["full"]
         for binding in UserTelegramBinding.objects.filter(owner=request.user):
-            Thread(target=fetch_channels, args=(binding,)).start()
+            Thread(target=fetch_channels, args=(binding, full)).start()
         return Response({"status": "ok"}, 200)
 
 
-def fetch_channels(binding: UserTelegramBinding):
-    channels = []
-    with TelegramPublisher(binding.session_string) as tg:
-        for channel in tg.get_channels():
-            channels.append(
-                {
-                    "id": channel.id,
-                    "type": "telegram",
-                    "name": channel.title,
-                    "binding": binding.id,
-                }
-            )
-    binding.fetched_channels = channels
-    binding.save()
+def fetch_channels(binding: UserTelegramBinding, full: bool = False):
+    previous = {chan["id"]: chan for chan in binding.fetched_channels}
+    with TelegramPublisher(binding, priority=Priority.BACKGROUND) as tg:
+        changes = None
+        if not full and binding.dialogs_state:
+            changes, state = tg.get_channel_changes(binding.dialogs_state)
+
+        if changes is None:
+            state = tg.get_updates_state()
+            channels = {
+                channel.id: _channel_entry(binding, channel.id, channel.title)
+                for channel in tg.get_channels()
+            }
+        else:
+            channels = dict(previous)
+            for chat_id, title in changes.items():
+                if title is None:
+                    channels.pop(chat_id, None)
+                else:
+                    channels[chat_id] = _channel_entry(binding, chat_id, title)
+
+    diff = {
+        "added": [
+            chat_id for chat_id in channels if chat_id not in previous
+        ],
+        "removed": [
+            chat_id for chat_id in previous if chat_id not in channels
+        ],
+        "renamed": [
+            chat_id
+            for chat_id, chan in channels.items()
+            if chat_id in previous
+            and previous[chat_id]["name"] != chan["name"]
+        ],
+    }
+    logging.info(f"Channels of binding {binding.id} changed: {diff}")
+
+    binding.fetched_channels = list(channels.values())
+    binding.dialogs_state = state
+    binding.channels_diff = diff
+    binding.save(
+        update_fields=["fetched_channels", "dialogs_state", "channels_diff"]
+    )
+    return diff
+
+
+def _channel_entry(binding: UserTelegramBinding, chat_id: int, title: str):
+    return {
+        "id": chat_id,
+        "type": "telegram",
+        "name": title,
+        "binding": binding.id,
+    }
@@ -28,7 +28,7 @@ class ChannelListCreateView(ListCreateAPIView):
     def create(self, request, *args, **kwargs):
         request.data["project"] = self.kwargs["pk"]
         binding = get_object_or_404(UserTelegramBinding, id=request.data["binding"])
-        with TelegramPublisher(binding.session_string) as t:
+        with TelegramPublisher(binding) as t:
             chat = t.get_chat(request.data["channel_id"])
             request.data["name"] = chat.title
             request.data["is_group"] = chat.type == ChatType.SUPERGROUP
@@ -1,5 +1,8 @@
+import hashlib
 from datetime import timedelta, datetime, date
+from threading import Thread
 
+from django.conf import settings
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from rest_framework.generics import (
@@ -16,15 +19,17 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
 
+from api import stats
 from api.models import (
     Post,
     PostWatch,
     UserTelegramBinding,
-    PostMeasurement,
     PostFile,
     Channel,
     WorkflowPush,
     Project,
+    FileUpload,
+    FilePreload,
 )
 from api.permissions import (
     IsOwnerOfCurrentProject,
@@ -38,12 +43,19 @@ from api.scheduler import (
     force_watch_for_post,
 )
 from api.serializers import (
+    ChannelSerializer,
     PostSerializer,
     PostMeasurementSerializer,
+    PostMeasurementRollupSerializer,
     PostFileSerializer,
     FileListSerializer,
+    FileUploadSerializer,
+    FileUploadCreateSerializer,
 )
-from social_networks.tg import TelegramPublisher
+from api.uploads import move_by_content
+from social_networks.tg import TelegramPublisher, preload_to_telegram
+
+COPY_BLOCK_SIZE = 64 * 1024
 
 
 def try_to_schedule(request, old_obj, obj):
@@ -123,50 +135,108 @@ class PostGeneratePreviewView(CreateAPIView):
 
         binding = UserTelegramBinding.objects.filter(owner=request.user).last()
 
-        with TelegramPublisher(binding.session_string) as tg:
-            if post.project.preview_channel is None:
-                chat = tg.ensure_channel("smm-client-preview")
-                preview_channel, _ = Channel.objects.get_or_create(
-                    project=post.project,
-                    channel_id=chat.id,
-                    type="telegram",
-                    is_group=False,
-                    name="smm-client-preview",
-                    binding=binding,
-                )
-                post.project.preview_channel = preview_channel
-                post.project.save()
-
-            msg = tg.publish(
-                post.project.preview_channel.channel_id,
-                post,
+        with TelegramPublisher(binding) as tg:
+            # a deleted or inaccessible preview channel is looked up
+            # again and the publish retried
+            chat_id, msg = tg.with_preview_channel(
+                lambda chat_id: (chat_id, tg.publish(chat_id, post))
+            )
+
+        project = post.project
+        if (
+            project.preview_channel is None
+            or project.preview_channel.channel_id != str(chat_id)
+        ):
+            project.preview_channel, _ = Channel.objects.get_or_create(
+                project=project,
+                channel_id=chat_id,
+                type="telegram",
+                is_group=False,
+                name="smm-client-preview",
+                binding=binding,
             )
+            project.save(update_fields=["preview_channel"])
 
         return Response({"link": msg.link}, 200)
 
 
 class PostStatListView(ListAPIView):
-    serializer_class = PostMeasurementSerializer
-    queryset = PostMeasurement.objects.filter(views__gt=1)
+    """Statistics of a post for the last ``days`` days, 0 for all.
+
+    Raw measurements are returned while the window is within their
+    retention; longer windows are served from hourly or daily rollups.
+
+    With ``?bucket=5m|1h|1d`` the series is resampled to that bucket and
+    returned in columns: one timestamp array shared by every channel and
+    one value array per channel and metric, with channels listed once.
+    """
+
     permission_classes = (CanInteractWithCurrentProject, IsAuthenticated)
 
-    def get_queryset(self):
-        # force_watch_for_post(Post.objects.get(id=self.kwargs["post_id"]))
+    def get_since(self):
         if self.kwargs["days"] > 0:
             current_date = timezone.now().date()
             start_date = current_date - timedelta(days=self.kwargs["days"])
-            return (
-                super()
-                .get_queryset()
-                .filter(
-                    post__id=self.kwargs["post_id"], created_at__gte=start_date
-                )
+            return timezone.make_aware(
+                datetime.combine(start_date, datetime.min.time())
             )
-        else:
-            return (
-                super().get_queryset().filter(post__id=self.kwargs["post_id"])
+        return None
+
+    def get_resolution(self):
+        return stats.pick_resolution(self.get_since())
+
+    def get_serializer_class(self):
+        if self.get_resolution() == stats.RAW:
+            return PostMeasurementSerializer
+        return PostMeasurementRollupSerializer
+
+    def get_queryset(self):
+        # force_watch_for_post(Post.objects.get(id=self.kwargs["post_id"]))
+        series = stats.get_series(
+            self.kwargs["post_id"], self.get_since(), self.get_resolution()
+        )
+        if self.get_resolution() == stats.RAW:
+            return [x for x in series if x.views > 1]
+        return [x for x in series if x.views_last > 1]
+
+    def list(self, request, *args, **kwargs):
+        if "bucket" not in request.query_params:
+            return super().list(request, *args, **kwargs)
+        width = stats.SERIES_BUCKETS.get(request.query_params["bucket"])
+        if width is None:
+            return Response(
+                {
+                    "error": "bucket must be one of "
+                    + ", ".join(stats.SERIES_BUCKETS)
+                },
+                400,
             )
 
+        timestamps, columns = stats.resample(
+            self.kwargs["post_id"], self.get_since(), width
+        )
+        # like the row mode, channels that never passed 1 view are left out
+        columns = {
+            channel_id: values
+            for channel_id, values in columns.items()
+            if any(views and views > 1 for views in values["views"])
+        }
+        channels = Channel.objects.in_bulk(columns)
+        return Response(
+            {
+                "bucket": request.query_params["bucket"],
+                "timestamps": [int(x.timestamp()) for x in timestamps],
+                "channels": ChannelSerializer(
+                    [channels[channel_id] for channel_id in columns],
+                    many=True,
+                ).data,
+                "series": [
+                    {"channel": channel_id, **values}
+                    for channel_id, values in columns.items()
+                ],
+            }
+        )
+
 
 class UploadFilesView(APIView):
     parser_classes = (MultiPartParser,)
@@ -180,6 +250,140 @@ class UploadFilesView(APIView):
         return Response({"status": "ok"}, status=201)
 
 
+class FileUploadCreateView(APIView):
+    """Starts a chunked upload; see ``FileUploadView`` for the chunks."""
+
+    permission_classes = (CanInteractWithCurrentProject, IsAuthenticated)
+
+    def post(self, request, **kwargs):
+        post = get_object_or_404(Post, id=kwargs["post_id"])
+        self.check_object_permissions(request, post)
+        serializer = FileUploadCreateSerializer(post=post, data=request.data)
+        serializer.is_valid(raise_exception=True)
+        upload = serializer.save()
+        return Response(
+            {
+                **FileUploadSerializer(upload).data,
+                "chunk_size": settings.FILE_UPLOAD_CHUNK_SIZE,
+            },
+            status=201,
+        )
+
+
+class FileUploadView(APIView):
+    """Progress of a chunked upload (GET) and its next chunk (PATCH).
+
+    A chunk is the raw request body. ``Upload-Offset`` must equal the
+    number of bytes received so far and ``Upload-Checksum`` is the hex
+    SHA-256 of the chunk; a chunk that fails the check is dropped, so
+    the client resumes from ``received`` after any error.
+    """
+
+    permission_classes = (CanInteractWithCurrentProject, IsAuthenticated)
+
+    def get_object(self, request, **kwargs) -> FileUpload:
+        upload = get_object_or_404(
+            FileUpload.objects.select_related("file__post"),
+            id=kwargs["pk"],
+            file__post__id=kwargs["post_id"],
+        )
+        self.check_object_permissions(request, upload.file)
+        return upload
+
+    def get(self, request, **kwargs):
+        upload = self.get_object(request, **kwargs)
+        return Response(FileUploadSerializer(upload).data, 200)
+
+    def patch(self, request, **kwargs):
+        upload = self.get_object(request, **kwargs)
+        if upload.status != FileUpload.Status.RECEIVING:
+            return Response({"error": f"upload is {upload.status}"}, 409)
+        try:
+            offset = int(request.headers["Upload-Offset"])
+            length = int(request.headers["Content-Length"])
+        except (KeyError, ValueError):
+            return Response({"error": "bad offset or length"}, 400)
+        checksum = request.headers.get("Upload-Checksum", "").lower()
+        if not checksum:
+            return Response({"error": "no checksum"}, 400)
+        if offset != upload.received:
+            return Response(
+                {"error": "bad offset", "received": upload.received}, 409
+            )
+        if (
+            length <= 0
+            or length > settings.FILE_UPLOAD_CHUNK_SIZE
+            or offset + length > upload.size
+        ):
+            return Response({"error": "bad chunk length"}, 400)
+
+        if not write_chunk(
+            upload.file.file.path, offset, length, request.stream, checksum
+        ):
+            return Response(
+                {"error": "checksum mismatch", "received": upload.received},
+                400,
+            )
+        updated = FileUpload.objects.filter(
+            pk=upload.pk, received=offset
+        ).update(received=offset + length, updated_at=timezone.now())
+        if not updated:
+            upload.refresh_from_db()
+            return Response(
+                {"error": "bad offset", "received": upload.received}, 409
+            )
+
+        upload.refresh_from_db()
+        if upload.received == upload.size:
+            finish_upload(upload)
+        return Response(FileUploadSerializer(upload).data, 200)
+
+
+def write_chunk(
+    path: str, offset: int, length: int, stream, checksum: str
+) -> bool:
+    digest = hashlib.sha256()
+    remaining = length
+    with open(path, "r+b") as f:
+        f.seek(offset)
+        while remaining and stream is not None:
+            block = stream.read(min(remaining, COPY_BLOCK_SIZE))
+            if not block:
+                break
+            digest.update(block)
+            f.write(block)
+            remaining -= len(block)
+        if remaining or digest.hexdigest() != checksum:
+            f.truncate(offset)
+            return False
+    return True
+
+
+def finish_upload(upload: FileUpload):
+    digest = hashlib.sha256()
+    with open(upload.file.file.path, "rb") as f:
+        while block := f.read(COPY_BLOCK_SIZE):
+            digest.update(block)
+    sha256 = digest.hexdigest()
+
+    if upload.sha256 and upload.sha256 != sha256:
+        upload.status = FileUpload.Status.FAILED
+    else:
+        upload.sha256 = sha256
+        upload.status = FileUpload.Status.DONE
+        move_by_content(upload.file, sha256)
+    upload.save(update_fields=["sha256", "status", "updated_at"])
+
+    preloads = FilePreload.objects.filter(file=upload.file)
+    if (
+        upload.status == FileUpload.Status.DONE
+        and preloads.filter(status=FilePreload.Status.FAILED).exists()
+        and not preloads.filter(status=FilePreload.Status.UPLOADING).exists()
+    ):
+        # a preload that gave up on a stalled upload resumes now
+        Thread(target=preload_to_telegram, args=([upload.file],)).start()
+
+
 class PostFileListAPIView(ListAPIView):
     serializer_class = PostFileSerializer
     queryset = PostFile.objects.all()
@@ -179,6 +179,86 @@ SCHEDULER_CONFIG = {
     "apscheduler.executors.default": {"class": "apscheduler.executors.pool:ThreadPoolExecutor", "max_workers": 50},
 }
 SCHEDULER_AUTOSTART = True
+# Bindings polled at the same time by one watch cycle
+WATCH_MAX_WORKERS = 8
+# Publications are polled by age as (max age, poll interval, publications
+# per cycle), in seconds; older ones are no longer polled
+WATCH_TIERS = [
+    (60 * 60, 5 * 60, 2000),
+    (24 * 60 * 60, 60 * 60, 1000),
+    (30 * 24 * 60 * 60, 24 * 60 * 60, 500),
+]
+# Publications in the last tier whose views did not change for this many
+# polls are no longer polled until a forced poll sees new views; None
+# polls them until they age out
+WATCH_FREEZE_AFTER = None
+# Scheduled posts get their clients connected and warmed up this many
+# seconds before the slot
+PUBLISH_PREWARM = 20
+PUBLISH_MAX_WORKERS = 16
+# Unsent posts further past their slot than this, in seconds, are not
+# sent when the dispatcher starts
+PUBLISH_MISFIRE_GRACE = 15 * 60
+# How long post statistics are kept at each resolution, in seconds.
+# Older raw measurements are compacted into hourly rollups and older
+# hourly rollups into daily ones; None keeps them forever
+STATS_RETENTION = {
+    "raw": 2 * 24 * 60 * 60,
+    "hour": 60 * 24 * 60 * 60,
+    "day": None,
+}
+
+TELEGRAM_POOL_MAX_SIZE = 32
+TELEGRAM_POOL_IDLE_TIMEOUT = 15 * 60
+TELEGRAM_POOL_HEALTH_CHECK_INTERVAL = 60
+TELEGRAM_REPLIES_CONCURRENCY = 8
+TELEGRAM_REPLIES_CACHE_TTL = 15 * 60
+TELEGRAM_MAX_FLOOD_WAIT = 60
+TELEGRAM_SUBSCRIBERS_TTL = 60 * 60
+# A chat missing from the peer storage rescans the dialogs at most this
+# often per client, in seconds
+TELEGRAM_PEERS_RESCAN_COOLDOWN = 60
+TELEGRAM_PRELOAD_CONCURRENCY = 3
+# Failed preloads are retried after this many seconds, resuming from the
+# parts Telegram already has, up to TELEGRAM_PRELOAD_MAX_ATTEMPTS times
+TELEGRAM_PRELOAD_RETRY_DELAY = 5 * 60
+TELEGRAM_PRELOAD_MAX_ATTEMPTS = 5
+# Per binding and RPC class: (requests per second, burst size)
+TELEGRAM_RATE_LIMITS = {
+    "publish": (5, 10),
+    "upload": (20, 40),
+    "stats": (3, 10),
+    "dialogs": (0.5, 3),
+    "default": (5, 10),
+}
+# Share of every bucket that background requests leave for others
+TELEGRAM_BACKGROUND_RESERVE = 0.3
+# FLOOD_WAITs up to this many seconds are slept through and retried
+TELEGRAM_FLOOD_SLEEP_THRESHOLD = 10
+# Logins waiting for a code or password keep their client this long
+TELEGRAM_LOGIN_TTL = 10 * 60
+TELEGRAM_MAX_PENDING_LOGINS = 100
+# "pyrogram" talks to Telegram, "simulator" serves every binding from
+# the in-memory stand-in in social_networks.simulator
+TELEGRAM_BACKEND = os.environ.get("TELEGRAM_BACKEND", "pyrogram")
+TELEGRAM_SIMULATOR = {
+    "latency": 0.05,
+    "jitter": 0.02,
+    "flood_rate": 0.0,
+    "flood_seconds": 2,
+    "view_growth": 20,
+}
+# Streaming preloads give up when a chunked upload stalls this long
+TELEGRAM_UPLOAD_STALL_TIMEOUT = 10 * 60
+
+# Largest chunk accepted by the chunked upload endpoint
+FILE_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Uploaded files get their SHA-256 computed while they are received
+FILE_UPLOAD_HANDLERS = [
+    "api.uploads.HashingMemoryFileUploadHandler",
+    "api.uploads.HashingTemporaryFileUploadHandler",
+]
 
 STATIC_ROOT = "staticfiles"
 
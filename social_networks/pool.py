@@ -0,0 +1,227 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from pyrogram import Client, errors, raw
+
+from api.models import UserTelegramBinding
+from social_networks.reactor import reactor, settle
+from social_networks.storage import DatabaseStorage
+
+
+def create_client(binding_id: int, session_string: str) -> Client:
+    client = Client(
+        "smm-publisher",
+        session_string=session_string,
+        no_updates=True,
+        sleep_threshold=0,
+    )
+    client.storage = DatabaseStorage(binding_id, session_string)
+    return client
+
+
+def get_client_factory():
+    if settings.TELEGRAM_BACKEND == "simulator":
+        from social_networks.simulator import create_simulated_client
+
+        return create_simulated_client
+    return create_client
+
+
+class PooledClient:
+    """Connected pyrogram client living on the shared reactor loop.
+
+    The loop keeps running between leases, which keeps pings flowing
+    and the connection warm.
+    """
+
+    def __init__(self, key: int, session_string: str, client_factory):
+        self.key = key
+        self.session_string = session_string
+        self.client_factory = client_factory
+        self.leases = 0
+        self.retired = False
+        # when the dialogs were last scanned for peers
+        self.peers_fetched_at: "float | None" = None
+        self.last_used = time.monotonic()
+        self.last_checked = self.last_used
+        self.client = self.run(self._connect())
+
+    async def _connect(self) -> Client:
+        # pyrogram picks up the running loop when a client is created
+        client = self.client_factory(self.key, self.session_string)
+        client.binding_id = self.key
+        await client.start()
+        return client
+
+    def run(self, coroutine):
+        return reactor.run(coroutine)
+
+    def call(self, function, *args, **kwargs):
+        return self.run(settle(function, *args, **kwargs))
+
+    def is_healthy(self) -> bool:
+        if not self.client.is_connected:
+            return False
+        try:
+            self.call(self.client.invoke, raw.functions.updates.GetState())
+        except (errors.RPCError, OSError, ConnectionError, TimeoutError):
+            logging.exception(f"Health check failed for binding {self.key}")
+            return False
+        self.last_checked = time.monotonic()
+        return True
+
+    def close(self):
+        try:
+            self.call(self.client.stop)
+        except ConnectionError:
+            pass
+
+
+class ClientPool:
+    """Process-wide cache of connected clients keyed by binding.
+
+    Several leases of the same binding share one client. At most
+    ``max_size`` clients are kept warm; when every pooled client is
+    leased, an overflow client is created and closed on release.
+    Connecting and closing happen outside of the pool lock, so a slow
+    handshake only holds up leases of the same binding. Clients are
+    built by ``client_factory(binding_id, session_string)``.
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        idle_timeout: float,
+        health_check_interval: float,
+        client_factory=create_client,
+    ):
+        self.max_size = max_size
+        self.client_factory = client_factory
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self._clients: dict[int, PooledClient] = {}
+        self._binding_locks: dict[int, threading.Lock] = {}
+        self._closing: list[PooledClient] = []
+        self._lock = threading.Lock()
+
+    def acquire(self, binding: UserTelegramBinding) -> PooledClient:
+        with self._lock:
+            binding_lock = self._binding_locks.setdefault(
+                binding.id, threading.Lock()
+            )
+
+        with binding_lock:
+            with self._lock:
+                pooled = self._clients.get(binding.id)
+                if (
+                    pooled is not None
+                    and pooled.session_string != binding.session_string
+                ):
+                    self._close_later(self._retire(pooled))
+                    pooled = None
+                if pooled is not None:
+                    pooled.leases += 1
+
+            if pooled is not None and not self._check(pooled):
+                self.release(pooled)
+                with self._lock:
+                    self._close_later(self._retire(pooled))
+                pooled = None
+
+            if pooled is None:
+                pooled = PooledClient(
+                    binding.id, binding.session_string, self.client_factory
+                )
+                with self._lock:
+                    self._close_later(self._admit(pooled))
+                    pooled.leases += 1
+
+            self._close_pending()
+            pooled.last_used = time.monotonic()
+            return pooled
+
+    def release(self, pooled: PooledClient):
+        with self._lock:
+            pooled.leases -= 1
+            pooled.last_used = time.monotonic()
+            if pooled.retired and pooled.leases == 0:
+                self._close_later(pooled)
+        self._close_pending()
+
+    @contextmanager
+    def lease(self, binding: UserTelegramBinding):
+        pooled = self.acquire(binding)
+        try:
+            yield pooled
+        finally:
+            self.release(pooled)
+
+    def evict_idle(self):
+        now = time.monotonic()
+        with self._lock:
+            for pooled in list(self._clients.values()):
+                if (
+                    pooled.leases == 0
+                    and now - pooled.last_used > self.idle_timeout
+                ):
+                    logging.info(f"Evicting idle client {pooled.key}")
+                    self._close_later(self._retire(pooled))
+        self._close_pending()
+
+    def close_all(self):
+        with self._lock:
+            for pooled in list(self._clients.values()):
+                self._close_later(self._retire(pooled))
+        self._close_pending()
+
+    def _check(self, pooled: PooledClient) -> bool:
+        if time.monotonic() - pooled.last_checked < self.health_check_interval:
+            return True
+        return pooled.is_healthy()
+
+    def _admit(self, pooled: PooledClient) -> "PooledClient | None":
+        if len(self._clients) < self.max_size:
+            self._clients[pooled.key] = pooled
+            return None
+        idle = [
+            candidate
+            for candidate in self._clients.values()
+            if candidate.leases == 0
+        ]
+        if not idle:
+            logging.warning(
+                f"Client pool is full, binding {pooled.key} gets "
+                f"an overflow client"
+            )
+            pooled.retired = True
+            return None
+        evicted = self._retire(min(idle, key=lambda x: x.last_used))
+        self._clients[pooled.key] = pooled
+        return evicted
+
+    def _retire(self, pooled: PooledClient) -> "PooledClient | None":
+        if self._clients.get(pooled.key) is pooled:
+            del self._clients[pooled.key]
+        pooled.retired = True
+        return pooled if pooled.leases == 0 else None
+
+    def _close_later(self, pooled: "PooledClient | None"):
+        if pooled is not None:
+            self._closing.append(pooled)
+
+    def _close_pending(self):
+        with self._lock:
+            closing, self._closing = self._closing, []
+        for pooled in closing:
+            pooled.close()
+
+
+client_pool = ClientPool(
+    max_size=settings.TELEGRAM_POOL_MAX_SIZE,
+    idle_timeout=settings.TELEGRAM_POOL_IDLE_TIMEOUT,
+    health_check_interval=settings.TELEGRAM_POOL_HEALTH_CHECK_INTERVAL,
+    client_factory=get_client_factory(),
+)
@@ -0,0 +1,70 @@
+import asyncio
+import inspect
+import threading
+from concurrent.futures import Future
+
+
+async def settle(function, *args, **kwargs):
+    result = function(*args, **kwargs)
+    if inspect.isasyncgen(result):
+        return [item async for item in result]
+    if inspect.isawaitable(result):
+        return await result
+    return result
+
+
+class Reactor:
+    """Event loop thread that owns every Telegram client of the process.
+
+    pyrogram binds clients to the loop they were created on, so clients
+    are only created and used from coroutines submitted here. Django
+    code calls in through ``run``/``call`` from any thread and blocks
+    until the result is ready, while the loop multiplexes the I/O of
+    all clients.
+    """
+
+    def __init__(self, name: str = "tg-reactor"):
+        self.name = name
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever,
+                    name=self.name,
+                    daemon=True,
+                )
+                self._thread.start()
+            return self._loop
+
+    def submit(self, coroutine) -> Future:
+        if threading.current_thread() is self._thread:
+            coroutine.close()
+            raise RuntimeError(
+                "Blocking on the reactor from its own thread would deadlock"
+            )
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def run(self, coroutine, timeout: float | None = None):
+        return self.submit(coroutine).result(timeout)
+
+    def call(self, function, *args, **kwargs):
+        return self.run(settle(function, *args, **kwargs))
+
+    def stop(self):
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is None:
+            return
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+
+reactor = Reactor()
@@ -0,0 +1,440 @@
+import asyncio
+import itertools
+import random
+import time
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from pyrogram import Client, errors, raw, utils
+
+
+@dataclass
+class SimulatedMessage:
+    id: int
+    date: int
+    text: str
+    media: "raw.base.MessageMedia | None" = None
+    views: int = 0
+    forwards: int = 0
+    replies: int = 0
+    reactions: int = 0
+
+
+@dataclass
+class SimulatedChannel:
+    id: int
+    access_hash: int
+    title: str
+    megagroup: bool = False
+    subscribers: int = 0
+    messages: dict[int, SimulatedMessage] = field(default_factory=dict)
+    pts: int = 0
+
+    def post(self, text: str, media=None) -> SimulatedMessage:
+        self.pts += 1
+        message = SimulatedMessage(
+            id=len(self.messages) + 1,
+            date=int(time.time()),
+            text=text,
+            media=media,
+        )
+        self.messages[message.id] = message
+        return message
+
+
+@dataclass
+class SimulatedAccount:
+    user_id: int
+    channels: list[int] = field(default_factory=list)
+    rpc_counts: dict[str, int] = field(default_factory=dict)
+    flood_waits: int = 0
+
+
+class SimulatedTelegram:
+    """In-memory stand-in for the Telegram servers.
+
+    It answers the raw functions the publisher uses for publishing,
+    watching and dialog scans, with a configurable latency per request,
+    randomly injected FLOOD_WAITs and views that grow on every poll.
+    Each binding id is one account; channels are added with
+    ``add_channel``. The state lives on the reactor loop.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        flood_rate: float = 0.0,
+        flood_seconds: int = 2,
+        view_growth: int = 0,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.flood_rate = flood_rate
+        self.flood_seconds = flood_seconds
+        self.view_growth = view_growth
+        self.accounts: dict[int, SimulatedAccount] = {}
+        self.channels: dict[int, SimulatedChannel] = {}
+        self._ids = itertools.count(1_000_000)
+
+    def account(self, binding_id: int) -> SimulatedAccount:
+        if binding_id not in self.accounts:
+            self.accounts[binding_id] = SimulatedAccount(
+                user_id=next(self._ids)
+            )
+        return self.accounts[binding_id]
+
+    def add_channel(
+        self,
+        binding_id: int,
+        title: str,
+        subscribers: int = 1000,
+        megagroup: bool = False,
+    ) -> int:
+        """Create a channel administered by the binding, return its chat id."""
+        channel = self._create_channel(
+            self.account(binding_id), title, megagroup, subscribers
+        )
+        return utils.get_peer_id(raw.types.PeerChannel(channel_id=channel.id))
+
+    async def handle(self, account: SimulatedAccount, query):
+        if isinstance(query, raw.functions.InvokeWithoutUpdates):
+            query = query.query
+        name = query.QUALNAME
+        account.rpc_counts[name] = account.rpc_counts.get(name, 0) + 1
+
+        delay = random.gauss(self.latency, self.jitter)
+        await asyncio.sleep(max(0.0, delay))
+        if self.flood_rate and random.random() < self.flood_rate:
+            account.flood_waits += 1
+            raise errors.FloodWait(value=self.flood_seconds)
+
+        handler = getattr(
+            self, "_" + name.removeprefix("functions.").replace(".", "_"), None
+        )
+        if handler is None:
+            raise NotImplementedError(f"Simulator does not handle {name}")
+        return handler(account, query)
+
+    # raw functions
+
+    def _updates_GetState(self, account, query):
+        return raw.types.updates.State(
+            pts=self._pts(account),
+            qts=0,
+            date=int(time.time()),
+            seq=0,
+            unread_count=0,
+        )
+
+    def _updates_GetDifference(self, account, query):
+        return raw.types.updates.DifferenceEmpty(date=int(time.time()), seq=0)
+
+    def _messages_GetDialogs(self, account, query):
+        ids = list(reversed(account.channels))
+        if isinstance(query.offset_peer, raw.types.InputPeerChannel):
+            ids = ids[ids.index(query.offset_peer.channel_id) + 1 :]
+        ids = ids[: query.limit or 100]
+
+        dialogs, messages = [], []
+        for channel_id in ids:
+            channel = self.channels[channel_id]
+            top = channel.messages.get(len(channel.messages))
+            peer = raw.types.PeerChannel(channel_id=channel_id)
+            dialogs.append(
+                raw.types.Dialog(
+                    peer=peer,
+                    top_message=top.id if top else 0,
+                    read_inbox_max_id=0,
+                    read_outbox_max_id=0,
+                    unread_count=0,
+                    unread_mentions_count=0,
+                    unread_reactions_count=0,
+                    notify_settings=raw.types.PeerNotifySettings(),
+                )
+            )
+            if top:
+                messages.append(self._message(channel, top))
+        return raw.types.messages.DialogsSlice(
+            count=len(account.channels),
+            dialogs=dialogs,
+            messages=messages,
+            chats=[self._chat(account, self.channels[i]) for i in ids],
+            users=[],
+        )
+
+    def _channels_GetChannels(self, account, query):
+        return raw.types.messages.Chats(
+            chats=[
+                self._chat(account, self._channel(channel))
+                for channel in query.id
+            ]
+        )
+
+    def _channels_GetFullChannel(self, account, query):
+        channel = self._channel(query.channel)
+        return raw.types.messages.ChatFull(
+            full_chat=raw.types.ChannelFull(
+                id=channel.id,
+                about="",
+                read_inbox_max_id=0,
+                read_outbox_max_id=0,
+                unread_count=0,
+                chat_photo=raw.types.PhotoEmpty(id=0),
+                notify_settings=raw.types.PeerNotifySettings(),
+                bot_info=[],
+                pts=channel.pts,
+                participants_count=channel.subscribers,
+            ),
+            chats=[self._chat(account, channel)],
+            users=[],
+        )
+
+    def _channels_CreateChannel(self, account, query):
+        channel = self._create_channel(account, query.title, query.megagroup)
+        return self._updates(account, channel, [])
+
+    def _folders_EditPeerFolders(self, account, query):
+        return raw.types.Updates(
+            updates=[], users=[], chats=[], date=int(time.time()), seq=0
+        )
+
+    def _messages_SendMessage(self, account, query):
+        channel = self._channel(query.peer)
+        return self._updates(account, channel, [channel.post(query.message)])
+
+    def _messages_SendMedia(self, account, query):
+        channel = self._channel(query.peer)
+        message = channel.post(query.message, self._media(query.media))
+        return self._updates(account, channel, [message])
+
+    def _messages_SendMultiMedia(self, account, query):
+        channel = self._channel(query.peer)
+        return self._updates(
+            account,
+            channel,
+            [
+                channel.post(item.message, self._media(item.media))
+                for item in query.multi_media
+            ],
+        )
+
+    def _upload_SaveFilePart(self, account, query):
+        return True
+
+    def _upload_SaveBigFilePart(self, account, query):
+        return True
+
+    def _messages_GetMessagesViews(self, account, query):
+        channel = self._channel(query.peer)
+        views = []
+        for message_id in query.id:
+            message = channel.messages.get(message_id)
+            if message is None:
+                views.append(raw.types.MessageViews())
+                continue
+            if self.view_growth:
+                message.views = min(
+                    channel.subscribers,
+                    message.views + random.randint(0, self.view_growth),
+                )
+                message.reactions += random.random() < 0.1
+            views.append(
+                raw.types.MessageViews(
+                    views=message.views,
+                    forwards=message.forwards,
+                    replies=raw.types.MessageReplies(
+                        replies=message.replies, replies_pts=channel.pts
+                    ),
+                )
+            )
+        return raw.types.messages.MessageViews(
+            views=views, chats=[self._chat(account, channel)], users=[]
+        )
+
+    def _messages_GetMessagesReactions(self, account, query):
+        channel = self._channel(query.peer)
+        peer = raw.types.PeerChannel(channel_id=channel.id)
+        updates = [
+            raw.types.UpdateMessageReactions(
+                peer=peer,
+                msg_id=message.id,
+                reactions=raw.types.MessageReactions(
+                    results=[
+                        raw.types.ReactionCount(
+                            reaction=raw.types.ReactionEmoji(emoticon="👍"),
+                            count=message.reactions,
+                        )
+                    ]
+                ),
+            )
+            for message in map(channel.messages.get, query.id)
+            if message is not None
+        ]
+        return raw.types.Updates(
+            updates=updates,
+            users=[],
+            chats=[self._chat(account, channel)],
+            date=int(time.time()),
+            seq=0,
+        )
+
+    # helpers
+
+    def _create_channel(
+        self,
+        account: SimulatedAccount,
+        title: str,
+        megagroup: bool,
+        subscribers: int = 0,
+    ) -> SimulatedChannel:
+        channel = SimulatedChannel(
+            id=next(self._ids),
+            access_hash=random.getrandbits(63),
+            title=title,
+            megagroup=bool(megagroup),
+            subscribers=subscribers,
+        )
+        self.channels[channel.id] = channel
+        account.channels.append(channel.id)
+        return channel
+
+    def _channel(self, peer) -> SimulatedChannel:
+        channel = self.channels.get(getattr(peer, "channel_id", None))
+        if channel is None:
+            raise errors.ChannelInvalid()
+        return channel
+
+    def _pts(self, account: SimulatedAccount) -> int:
+        return sum(self.channels[i].pts for i in account.channels)
+
+    def _chat(self, account, channel: SimulatedChannel) -> raw.types.Channel:
+        is_admin = channel.id in account.channels
+        return raw.types.Channel(
+            id=channel.id,
+            title=channel.title,
+            photo=raw.types.ChatPhotoEmpty(),
+            date=0,
+            creator=is_admin,
+            broadcast=not channel.megagroup,
+            megagroup=channel.megagroup,
+            access_hash=channel.access_hash,
+            admin_rights=(
+                raw.types.ChatAdminRights(post_messages=True)
+                if is_admin
+                else None
+            ),
+            participants_count=channel.subscribers,
+            restriction_reason=[],
+        )
+
+    def _message(self, channel, message: SimulatedMessage):
+        return raw.types.Message(
+            id=message.id,
+            peer_id=raw.types.PeerChannel(channel_id=channel.id),
+            date=message.date,
+            message=message.text or "",
+            post=not channel.megagroup,
+            media=message.media,
+            entities=[],
+            restriction_reason=[],
+            views=message.views,
+            forwards=message.forwards,
+        )
+
+    def _updates(self, account, channel, messages) -> raw.types.Updates:
+        return raw.types.Updates(
+            updates=[
+                raw.types.UpdateNewChannelMessage(
+                    message=self._message(channel, message),
+                    pts=channel.pts,
+                    pts_count=1,
+                )
+                for message in messages
+            ],
+            users=[],
+            chats=[self._chat(account, channel)],
+            date=int(time.time()),
+            seq=0,
+        )
+
+    def _media(self, media) -> "raw.types.MessageMediaDocument | None":
+        if isinstance(media, raw.types.InputMediaUploadedDocument):
+            mime_type, attributes = media.mime_type, media.attributes
+        elif isinstance(media, raw.types.InputMediaDocument):
+            mime_type, attributes = "application/octet-stream", []
+        else:
+            return None
+        return raw.types.MessageMediaDocument(
+            document=raw.types.Document(
+                id=random.getrandbits(63),
+                access_hash=random.getrandbits(63),
+                file_reference=b"",
+                date=int(time.time()),
+                mime_type=mime_type,
+                size=0,
+                dc_id=2,
+                attributes=attributes,
+                thumbs=[],
+                video_thumbs=[],
+            )
+        )
+
+
+class SimulatedSession:
+    def __init__(self, telegram: SimulatedTelegram, account: SimulatedAccount):
+        self.telegram = telegram
+        self.account = account
+
+    async def invoke(
+        self, query, retries=None, timeout=None, sleep_threshold=0
+    ):
+        return await self.telegram.handle(self.account, query)
+
+
+class SimulatedClient(Client):
+    """pyrogram client whose session is served by ``SimulatedTelegram``.
+
+    Only the transport is replaced: high-level methods, peer storage and
+    the patched ``invoke`` with its flood control run unchanged.
+    """
+
+    def __init__(self, telegram: SimulatedTelegram, binding_id: int):
+        super().__init__(
+            f"simulated-{binding_id}",
+            in_memory=True,
+            no_updates=True,
+            sleep_threshold=0,
+        )
+        self.telegram = telegram
+        self.account = telegram.account(binding_id)
+
+    async def connect(self) -> bool:
+        await self.storage.open()
+        self.session = SimulatedSession(self.telegram, self.account)
+        # uploads look for a media session of the home DC
+        self.media_sessions[await self.storage.dc_id()] = self.session
+        self.is_connected = True
+        return True
+
+    async def disconnect(self):
+        self.is_connected = False
+        self.media_sessions.clear()
+        await self.storage.close()
+
+    async def start(self):
+        await self.connect()
+        await self.storage.user_id(self.account.user_id)
+        await self.storage.is_bot(False)
+        return self
+
+    async def stop(self, block: bool = True):
+        await self.disconnect()
+        return self
+
+
+telegram = SimulatedTelegram(**settings.TELEGRAM_SIMULATOR)
+
+
+def create_simulated_client(binding_id: int, session_string: str):
+    return SimulatedClient(telegram, binding_id)
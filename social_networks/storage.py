@@ -0,0 +1,103 @@
+from datetime import timedelta
+from typing import List, Tuple
+
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+from pyrogram.storage import MemoryStorage
+
+from api.models import TelegramPeer
+
+PeerRow = Tuple[int, int, str, str, str]
+
+
+class DatabaseStorage(MemoryStorage):
+    """Session storage that keeps resolved peers in ``TelegramPeer``.
+
+    Auth data still comes from the binding's session string, but peers
+    (and their access hashes) survive restarts and are shared by every
+    process that serves the binding. Only new or changed peers are
+    written back.
+    """
+
+    def __init__(self, binding_id: int, session_string: str):
+        super().__init__(f"smm-binding-{binding_id}", session_string)
+        self.binding_id = binding_id
+
+    async def open(self):
+        await super().open()
+        await super().update_peers(await sync_to_async(self._load)())
+
+    async def update_peers(self, peers: List[PeerRow]):
+        changed = {peer[0]: peer for peer in peers if self._is_changed(peer)}
+        await super().update_peers(peers)
+        if changed:
+            await sync_to_async(self._persist)(list(changed.values()))
+
+    async def get_peer_by_id(self, peer_id: int):
+        try:
+            return await super().get_peer_by_id(peer_id)
+        except KeyError:
+            pass
+        try:
+            peer_id = int(peer_id)
+        except ValueError:
+            raise KeyError(f"ID not found: {peer_id}")
+        await self._load_missing(peer_id=peer_id)
+        return await super().get_peer_by_id(peer_id)
+
+    async def get_peer_by_username(self, username: str):
+        try:
+            return await super().get_peer_by_username(username)
+        except KeyError:
+            pass
+        await self._load_missing(
+            username=username,
+            updated_at__gte=timezone.now()
+            - timedelta(seconds=self.USERNAME_TTL),
+        )
+        return await super().get_peer_by_username(username)
+
+    async def _load_missing(self, **lookup):
+        peers = await sync_to_async(self._load)(**lookup)
+        await super().update_peers(peers)
+
+    def _is_changed(self, peer: PeerRow) -> bool:
+        row = self.conn.execute(
+            "SELECT access_hash, type, username, phone_number "
+            "FROM peers WHERE id = ?",
+            (peer[0],),
+        ).fetchone()
+        return row is None or tuple(row) != tuple(peer[1:])
+
+    def _load(self, **lookup) -> List[PeerRow]:
+        return list(
+            TelegramPeer.objects.filter(
+                binding_id=self.binding_id, **lookup
+            ).values_list(
+                "peer_id", "access_hash", "type", "username", "phone_number"
+            )
+        )
+
+    def _persist(self, peers: List[PeerRow]):
+        TelegramPeer.objects.bulk_create(
+            [
+                TelegramPeer(
+                    binding_id=self.binding_id,
+                    peer_id=peer[0],
+                    access_hash=peer[1],
+                    type=peer[2],
+                    username=peer[3],
+                    phone_number=peer[4],
+                )
+                for peer in peers
+            ],
+            update_conflicts=True,
+            unique_fields=["binding", "peer_id"],
+            update_fields=[
+                "access_hash",
+                "type",
+                "username",
+                "phone_number",
+                "updated_at",
+            ],
+        )
@@ -1,17 +1,36 @@
 import asyncio
+import functools
 import logging
+import math
+import os
+import secrets
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
 from dataclasses import dataclass
+from enum import IntEnum
 from typing import List, Type
 
+from django.conf import settings
+from django.db import connection
 from PIL import Image
-from pyrogram import Client, types, errors, utils
+from pyrogram import Client, types, errors, utils, raw
 from pyrogram.enums import ParseMode, ChatType, MessageMediaType
+from pyrogram.session import Session
 from pyrogram.storage.sqlite_storage import SQLiteStorage
-from pyrogram.sync import wrap
-from pyrogram.types import Dialog
+from pyrogram.sync import wrap, async_to_sync
 
-from api.models import PostFile, Post, FileUploadedToTelegram
+from api.models import (
+    PostFile,
+    Post,
+    FileUploadedToTelegram,
+    UserTelegramBinding,
+    FilePreload,
+    FileUpload,
+)
+from social_networks.pool import PooledClient, client_pool
+from social_networks.reactor import reactor, settle
 
 API_ID = 14214181
 API_HASH = "XXX"
@@ -20,28 +39,459 @@ wrap(SQLiteStorage)
 
 AuthID = str
 
+COUNTERS_CHUNK_SIZE = 100
+PREVIEW_CHANNEL_TITLE = "smm-client-preview"
+DIFFERENCE_PTS_LIMIT = 5000
+PRELOAD_CAPTION = (
+    "Этот файл был загружен в этот канал в целях быстродействия. "
+    "Не обращайте внимания. Пожалуйста, не удаляйте его."
+)
+UPLOAD_PART_SIZE = 512 * 1024
+BIG_FILE_SIZE = 10 * 1024 * 1024
+UPLOAD_WINDOW = 4
+PREVIEW_GONE_ERRORS = (
+    KeyError,
+    errors.ChannelInvalid,
+    errors.ChannelPrivate,
+    errors.PeerIdInvalid,
+)
 
-@staticmethod
-def Dialog__parse(client, dialog, messages, users, chats) -> "Dialog":
-    dialog_channel = chats.get(utils.get_raw_peer_id(dialog.peer))
-    if dialog_channel:
-        is_admin = bool(getattr(dialog_channel, "admin_rights", None))
-    else:
-        is_admin = None
-
-    dialog = Dialog(
-        chat=types.Chat._parse_dialog(client, dialog.peer, users, chats),
-        top_message=messages.get(utils.get_peer_id(dialog.peer)),
-        unread_messages_count=dialog.unread_count,
-        unread_mentions_count=dialog.unread_mentions_count,
-        unread_mark=dialog.unread_mark,
-        is_pinned=dialog.pinned,
+
+class Priority(IntEnum):
+    PUBLISH = 0
+    DEFAULT = 1
+    BACKGROUND = 2
+
+
+rpc_priority: ContextVar[Priority] = ContextVar(
+    "rpc_priority", default=Priority.DEFAULT
+)
+
+RPC_CLASSES = {
+    "functions.messages.SendMessage": "publish",
+    "functions.messages.SendMedia": "publish",
+    "functions.messages.SendMultiMedia": "publish",
+    "functions.messages.ForwardMessages": "publish",
+    "functions.messages.UploadMedia": "upload",
+    "functions.upload.SaveFilePart": "upload",
+    "functions.upload.SaveBigFilePart": "upload",
+    "functions.messages.GetMessagesViews": "stats",
+    "functions.messages.GetMessagesReactions": "stats",
+    "functions.messages.GetReplies": "stats",
+    "functions.channels.GetFullChannel": "stats",
+    "functions.channels.GetParticipants": "stats",
+    "functions.messages.GetDialogs": "dialogs",
+    "functions.messages.GetPeerDialogs": "dialogs",
+    "functions.updates.GetDifference": "dialogs",
+    "functions.channels.CreateChannel": "dialogs",
+}
+
+
+class TokenBucket:
+    """Token bucket whose rate backs off on FLOOD_WAIT and slowly recovers."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.base_rate = rate
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.blocked_until = 0.0
+        self.updated_at = time.monotonic()
+
+    def take(self, now: float, reserve: float = 0.0) -> float:
+        """Take a token and return 0, or return how long to wait."""
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated_at) * self.rate
+        )
+        self.updated_at = now
+        needed = 1 + reserve * self.capacity
+        if self.tokens >= needed:
+            self.tokens -= 1
+            return 0.0
+        return (needed - self.tokens) / self.rate
+
+    def penalize(self, now: float, seconds: float):
+        self.blocked_until = max(self.blocked_until, now + seconds)
+        self.rate = max(self.rate / 2, self.base_rate / 16)
+        self.tokens = 0.0
+        self.updated_at = now
+
+    def reward(self):
+        if self.rate < self.base_rate:
+            self.rate = min(self.base_rate, self.rate + self.base_rate / 20)
+
+
+class RateLimiter:
+    """Flood control shared by every pooled client.
+
+    Each (binding, RPC class) pair has its own token bucket. While a
+    binding has publish-priority requests in flight, its lower-priority
+    requests wait, and background requests never drain the last
+    ``background_reserve`` share of a bucket.
+    """
+
+    PRIORITY_POLL_INTERVAL = 0.05
+
+    def __init__(
+        self,
+        limits: dict[str, tuple[float, float]],
+        background_reserve: float,
+    ):
+        self.limits = limits
+        self.background_reserve = background_reserve
+        self._buckets: dict[tuple[int, str], TokenBucket] = {}
+        self._urgent: dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    async def acquire(
+        self, binding_id: int, rpc_class: str, priority: Priority
+    ):
+        while True:
+            with self._lock:
+                wait = self._take(binding_id, rpc_class, priority)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def begin(self, binding_id: int, priority: Priority):
+        if priority == Priority.PUBLISH:
+            with self._lock:
+                self._urgent[binding_id] = self._urgent.get(binding_id, 0) + 1
+
+    def end(self, binding_id: int, priority: Priority):
+        if priority == Priority.PUBLISH:
+            with self._lock:
+                self._urgent[binding_id] -= 1
+
+    def on_flood_wait(self, binding_id: int, rpc_class: str, seconds: int):
+        logging.warning(
+            f"FLOOD_WAIT of {seconds}s for {rpc_class} on binding {binding_id}"
+        )
+        with self._lock:
+            self._bucket(binding_id, rpc_class).penalize(
+                time.monotonic(), seconds
+            )
+
+    def on_success(self, binding_id: int, rpc_class: str):
+        with self._lock:
+            self._bucket(binding_id, rpc_class).reward()
+
+    def _take(
+        self, binding_id: int, rpc_class: str, priority: Priority
+    ) -> float:
+        if priority > Priority.PUBLISH and self._urgent.get(binding_id):
+            return self.PRIORITY_POLL_INTERVAL
+        reserve = (
+            self.background_reserve if priority == Priority.BACKGROUND else 0.0
+        )
+        return self._bucket(binding_id, rpc_class).take(
+            time.monotonic(), reserve
+        )
+
+    def _bucket(self, binding_id: int, rpc_class: str) -> TokenBucket:
+        key = (binding_id, rpc_class)
+        if key not in self._buckets:
+            self._buckets[key] = TokenBucket(
+                *self.limits.get(rpc_class, self.limits["default"])
+            )
+        return self._buckets[key]
+
+
+rate_limiter = RateLimiter(
+    limits=settings.TELEGRAM_RATE_LIMITS,
+    background_reserve=settings.TELEGRAM_BACKGROUND_RESERVE,
+)
+
+_invoke = Client.invoke.__wrapped__
+
+
+async def Client__invoke(self, query, *args, **kwargs):
+    return await invoke_limited(
+        self, query, lambda: _invoke(self, query, *args, **kwargs)
     )
-    dialog.is_admin = is_admin
-    return dialog
 
 
-types.Dialog._parse = Dialog__parse
+async def invoke_limited(client: Client, query, invoke):
+    """Run ``invoke()`` for ``query`` under the binding's flood control."""
+    binding_id = getattr(client, "binding_id", None)
+    if binding_id is None:
+        return await invoke()
+
+    rpc_class = RPC_CLASSES.get(query.QUALNAME, "default")
+    priority = rpc_priority.get()
+    rate_limiter.begin(binding_id, priority)
+    try:
+        while True:
+            await rate_limiter.acquire(binding_id, rpc_class, priority)
+            try:
+                result = await invoke()
+            except errors.FloodWait as e:
+                rate_limiter.on_flood_wait(binding_id, rpc_class, e.value)
+                if e.value > settings.TELEGRAM_FLOOD_SLEEP_THRESHOLD:
+                    raise
+                continue
+            rate_limiter.on_success(binding_id, rpc_class)
+            return result
+    finally:
+        rate_limiter.end(binding_id, priority)
+
+
+Client.invoke = Client__invoke
+async_to_sync(Client, "invoke")
+
+
+def get_file_id(message: types.Message) -> tuple[str, str]:
+    media_type = message.media.value
+    return getattr(message, media_type).file_id, media_type
+
+
+def is_file_reference_error(error: errors.RPCError) -> bool:
+    return isinstance(
+        error,
+        (
+            errors.FileReferenceEmpty,
+            errors.FileReferenceExpired,
+            errors.FileReferenceInvalid,
+        ),
+    ) or "FILE_REFERENCE" in str(error.value)
+
+
+def chunked(items: list, size: int):
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+@dataclass
+class MessageCounters:
+    views: int
+    forwards: int
+    replies: int | None
+
+
+@dataclass
+class MessageMetrics:
+    views: int
+    forwards: int
+    reactions: int
+    replies: int
+
+    @property
+    def actions(self) -> int:
+        return self.reactions + self.forwards + self.replies
+
+    def engagement_rate(self, subscribers: int) -> float:
+        return self.actions / subscribers if subscribers else 0.0
+
+
+@dataclass
+class ChannelRecord:
+    id: int
+    title: str
+    type: ChatType
+    is_admin: bool
+
+
+async def iter_channels(client: Client, admin_only: bool = True):
+    """Yield channels and supergroups straight from raw dialogs.
+
+    Unlike ``Client.get_dialogs`` no ``Chat`` or ``Message`` objects are
+    built: other dialogs are skipped by their raw peer type and top
+    messages are only used to page through the list.
+    """
+    offset_date = 0
+    offset_id = 0
+    offset_peer = raw.types.InputPeerEmpty()
+    while True:
+        r = await client.invoke(
+            raw.functions.messages.GetDialogs(
+                offset_date=offset_date,
+                offset_id=offset_id,
+                offset_peer=offset_peer,
+                limit=100,
+                hash=0,
+            )
+        )
+        dialogs = [d for d in r.dialogs if isinstance(d, raw.types.Dialog)]
+        if not dialogs:
+            return
+
+        chats = {chat.id: chat for chat in r.chats}
+        for dialog in dialogs:
+            if not isinstance(dialog.peer, raw.types.PeerChannel):
+                continue
+            channel = chats.get(dialog.peer.channel_id)
+            if not isinstance(channel, raw.types.Channel):
+                continue
+            is_admin = bool(channel.admin_rights)
+            if admin_only and not is_admin:
+                continue
+            yield ChannelRecord(
+                id=utils.get_peer_id(dialog.peer),
+                title=channel.title,
+                type=(
+                    ChatType.SUPERGROUP
+                    if channel.megagroup
+                    else ChatType.CHANNEL
+                ),
+                is_admin=is_admin,
+            )
+
+        last = dialogs[-1]
+        dates = {
+            (utils.get_peer_id(message.peer_id), message.id): message.date
+            for message in r.messages
+            if not isinstance(message, raw.types.MessageEmpty)
+        }
+        offset_id = last.top_message
+        offset_date = dates.get(
+            (utils.get_peer_id(last.peer), last.top_message), 0
+        )
+        offset_peer = await client.resolve_peer(utils.get_peer_id(last.peer))
+
+
+class ReplyCounter:
+    """Counts discussion replies of channel posts concurrently.
+
+    Runs on the loop of a pooled client. At most ``concurrency`` requests
+    are in flight per call, a FLOOD_WAIT pauses every request of the call
+    (up to ``max_flood_wait`` seconds), and counts are cached for ``ttl``
+    seconds. Channels without a linked discussion group and posts without
+    a thread are remembered and not queried again until the entry expires.
+    """
+
+    _MISSING = object()
+
+    def __init__(self, concurrency: int, ttl: float, max_flood_wait: int):
+        self.concurrency = concurrency
+        self.ttl = ttl
+        self.max_flood_wait = max_flood_wait
+        self._cache: dict[tuple, tuple[float, int | None]] = {}
+        self._lock = threading.Lock()
+        self._pruned_at = time.monotonic()
+
+    async def count(
+        self,
+        client: Client,
+        binding_id: int,
+        chat_id: "int | str",
+        message_ids: list[int],
+    ) -> dict[int, int]:
+        self._prune()
+        if not message_ids:
+            return {}
+        if not await self._has_discussion(client, binding_id, chat_id):
+            return {message_id: 0 for message_id in message_ids}
+
+        results = {}
+        pending = []
+        for message_id in message_ids:
+            cached = self._get((binding_id, chat_id, message_id))
+            if cached is self._MISSING:
+                pending.append(message_id)
+            else:
+                results[message_id] = cached or 0
+
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        resume_at = 0.0
+
+        async def fetch(message_id: int):
+            nonlocal resume_at
+            key = (binding_id, chat_id, message_id)
+            async with semaphore:
+                while True:
+                    delay = resume_at - loop.time()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    try:
+                        value = await client.get_discussion_replies_count(
+                            chat_id, message_id
+                        )
+                    except errors.FloodWait as e:
+                        if e.value > self.max_flood_wait:
+                            logging.warning(
+                                f"Skipping replies of {chat_id}: "
+                                f"flood wait of {e.value} seconds"
+                            )
+                            results[message_id] = 0
+                            return
+                        resume_at = max(resume_at, loop.time() + e.value)
+                        continue
+                    except errors.MsgIdInvalid:
+                        value = None
+                    except errors.RPCError:
+                        logging.exception(
+                            f"Failed to count replies of {message_id} "
+                            f"in {chat_id}"
+                        )
+                        results[message_id] = 0
+                        return
+                    break
+            self._set(key, value)
+            results[message_id] = value or 0
+
+        await asyncio.gather(*map(fetch, pending))
+        return results
+
+    def _get(self, key: tuple):
+        cached = self._cache.get(key)
+        if cached is None or time.monotonic() - cached[0] > self.ttl:
+            return self._MISSING
+        return cached[1]
+
+    def _set(self, key: tuple, value: "int | None"):
+        with self._lock:
+            self._cache[key] = (time.monotonic(), value)
+
+    async def _has_discussion(
+        self, client: Client, binding_id: int, chat_id: "int | str"
+    ) -> bool:
+        key = (binding_id, chat_id)
+        linked_chat_id = self._get(key)
+        if linked_chat_id is self._MISSING:
+            try:
+                chat = await client.get_chat(chat_id)
+            except errors.RPCError:
+                logging.exception(f"Failed to get discussion of {chat_id}")
+                return True
+            linked_chat_id = chat.linked_chat.id if chat.linked_chat else None
+            self._set(key, linked_chat_id)
+        return linked_chat_id is not None
+
+    def _prune(self):
+        now = time.monotonic()
+        if now - self._pruned_at < self.ttl:
+            return
+        with self._lock:
+            self._pruned_at = now
+            self._cache = {
+                key: cached
+                for key, cached in self._cache.items()
+                if now - cached[0] <= self.ttl
+            }
+
+
+reply_counter = ReplyCounter(
+    concurrency=settings.TELEGRAM_REPLIES_CONCURRENCY,
+    ttl=settings.TELEGRAM_REPLIES_CACHE_TTL,
+    max_flood_wait=settings.TELEGRAM_MAX_FLOOD_WAIT,
+)
+
+
+class LoginError(Exception):
+    pass
+
+
+class LoginExpired(LoginError):
+    def __init__(self):
+        super().__init__("login expired, request a new code")
+
+
+class TooManyLogins(LoginError):
+    def __init__(self):
+        super().__init__("too many pending logins, try again later")
 
 
 @dataclass
@@ -56,25 +506,51 @@ class AuthorizedUser:
     need_password: bool = False
 
 
+@dataclass
+class PendingLogin:
+    client: Client
+    phone_number: str
+    phone_code_hash: str
+    expires_at: float
+    lock: asyncio.Lock
+
+
 class TelegramAuthorizer:
+    """Login flow that keeps the connected client between steps.
+
+    ``send_code`` registers a pending login under an opaque ``auth_id``;
+    ``enter_code`` and ``enter_password`` reuse its client, so only the
+    first step pays for the handshake. Pending logins live in this
+    process for ``TELEGRAM_LOGIN_TTL`` seconds. The registry is only
+    touched from the reactor loop and needs no locking.
+    """
+
     _instance = None
 
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super().__new__(cls)
+            cls._instance._pending = {}
         return cls._instance
 
-    @staticmethod
-    def ensure_event_loop():
-        try:
-            asyncio.get_event_loop()
-        except RuntimeError:
-            asyncio.set_event_loop(asyncio.new_event_loop())
-
     def send_code(
         self, phone_number: str, *, test_mode: bool = False
     ) -> AuthID:
-        self.ensure_event_loop()
+        return reactor.run(self._send_code(phone_number, test_mode))
+
+    def enter_code(
+        self, auth_id: AuthID, code: str
+    ) -> AuthorizedUser | NeedPassword:
+        return reactor.run(self._enter_code(auth_id, code))
+
+    def enter_password(self, auth_id: AuthID, password: str) -> AuthorizedUser:
+        return reactor.run(self._enter_password(auth_id, password))
+
+    async def _send_code(self, phone_number: str, test_mode: bool) -> AuthID:
+        await self._prune()
+        if len(self._pending) >= settings.TELEGRAM_MAX_PENDING_LOGINS:
+            raise TooManyLogins()
+
         client = Client(
             "smm-sendcode",
             api_id=API_ID,
@@ -83,98 +559,134 @@ class TelegramAuthorizer:
             test_mode=test_mode,
         )
 
-        client.connect()
-        code = client.send_code(phone_number)
-        client.storage.user_id(0)
-        client.storage.is_bot(False)
-        session_string = client.export_session_string()
-        client.disconnect()
-
-        return ":".join(
-            [
-                session_string,
-                phone_number,
-                code.phone_code_hash,  # noqa
-            ]
+        await client.connect()
+        try:
+            code = await client.send_code(phone_number)
+        except BaseException:
+            await client.disconnect()
+            raise
+
+        auth_id = secrets.token_urlsafe(24)
+        self._pending[auth_id] = PendingLogin(
+            client=client,
+            phone_number=phone_number,
+            phone_code_hash=code.phone_code_hash,  # noqa
+            expires_at=time.monotonic() + settings.TELEGRAM_LOGIN_TTL,
+            lock=asyncio.Lock(),
         )
+        return auth_id
 
-    def enter_code(
+    async def _enter_code(
         self, auth_id: AuthID, code: str
     ) -> AuthorizedUser | NeedPassword:
-        session_string, phone_number, phone_code_hash = auth_id.split(":")
+        login = await self._get(auth_id)
+        async with login.lock:
+            self._check_pending(auth_id, login)
+            try:
+                user = await login.client.sign_in(
+                    login.phone_number, login.phone_code_hash, code
+                )
+            except (errors.PasswordRequired, errors.SessionPasswordNeeded):
+                return NeedPassword(auth_id)
+            return await self._finish(auth_id, user)
 
-        self.ensure_event_loop()
-        client = Client(
-            "smm-entercode",
-            session_string=session_string,
-        )
+    async def _enter_password(
+        self, auth_id: AuthID, password: str
+    ) -> AuthorizedUser:
+        login = await self._get(auth_id)
+        async with login.lock:
+            self._check_pending(auth_id, login)
+            user = await login.client.check_password(password)
+            return await self._finish(auth_id, user)
+
+    async def _get(self, auth_id: AuthID) -> PendingLogin:
+        await self._prune()
+        login = self._pending.get(auth_id)
+        if login is None:
+            raise LoginExpired()
+        return login
 
-        client.connect()
+    def _check_pending(self, auth_id: AuthID, login: PendingLogin):
+        if self._pending.get(auth_id) is not login:
+            raise LoginExpired()
+
+    async def _finish(self, auth_id: AuthID, user) -> AuthorizedUser:
+        login = self._pending.pop(auth_id)
         try:
-            print(phone_number, phone_code_hash, code)
-            user = client.sign_in(phone_number, phone_code_hash, code)
-        except (errors.PasswordRequired, errors.SessionPasswordNeeded):
-            return NeedPassword(auth_id)
-        else:
-            session_string = client.export_session_string()
+            session_string = await login.client.export_session_string()
         finally:
-            client.disconnect()
+            await login.client.disconnect()
 
         auth = AuthorizedUser()
         auth.user = user
         auth.session_string = session_string
         return auth
 
-    def enter_password(
-        self, code_hash: AuthID, password: str
-    ) -> AuthorizedUser:
-        session_string = code_hash.split(":")[0]
+    async def _prune(self):
+        now = time.monotonic()
+        expired = [
+            auth_id
+            for auth_id, login in self._pending.items()
+            if login.expires_at < now and not login.lock.locked()
+        ]
+        for auth_id in expired:
+            login = self._pending.pop(auth_id)
+            try:
+                await login.client.disconnect()
+            except ConnectionError:
+                pass
 
-        self.ensure_event_loop()
-        client = Client(
-            "smm-password",
-            session_string=session_string,
-        )
 
-        client.connect()
-        user = client.check_password(password)
-        session_string = client.export_session_string()
-        client.disconnect()
+class ClientProxy:
+    """Exposes the pyrogram ``Client`` API of a pooled client to any thread."""
 
-        auth = AuthorizedUser()
-        auth.user = user
-        auth.session_string = session_string
-        return auth
+    def __init__(self, publisher: "TelegramPublisher"):
+        self._publisher = publisher
+
+    def __getattr__(self, name):
+        attr = getattr(self._publisher._pooled.client, name)
+        if not callable(attr):
+            return attr
+        return functools.partial(self._call, attr)
+
+    def _call(self, function, *args, **kwargs):
+        return self._publisher._run(settle(function, *args, **kwargs))
 
 
 class TelegramPublisher:
-    def __init__(self, session_string: str):
-        self.ensure_event_loop()
-        self.client = Client(
-            "smm-publisher",
-            session_string=session_string,
-        )
-        self._fetched_peers = False
+    def __init__(
+        self,
+        binding: UserTelegramBinding,
+        priority: Priority = Priority.DEFAULT,
+    ):
+        self.binding = binding
+        self.priority = priority
+        self.client: ClientProxy | None = None
+        self._pooled: PooledClient | None = None
+        self._preview_lock = threading.Lock()
 
     def __enter__(self):
-        self.client.__enter__()
+        self.start()
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.client.__exit__(exc_type, exc_val, exc_tb)
+        self.stop()
 
     def start(self):
-        self.client.start()
+        self._pooled = client_pool.acquire(self.binding)
+        self.client = ClientProxy(self)
 
     def stop(self):
-        self.client.stop()
+        client_pool.release(self._pooled)
+        self._pooled = None
+        self.client = None
 
-    @staticmethod
-    def ensure_event_loop():
-        try:
-            asyncio.get_event_loop()
-        except RuntimeError:
-            asyncio.set_event_loop(asyncio.new_event_loop())
+    def _run(self, coroutine):
+        async def prioritized():
+            rpc_priority.set(self.priority)
+            return await coroutine
+
+        return self._pooled.run(prioritized())
 
     def prepare_file(
         self,
@@ -207,15 +719,116 @@ class TelegramPublisher:
 
         return media_type
 
-    def publish(self, chat_id: "int | str", post: Post) -> types.Message:
-        self._ensure_fetched_peers()
+    def upload_file(
+        self, chat_id: "int | str", post_file: PostFile, progress=None
+    ) -> types.Message:
+        path = post_file.file.path
+        if post_file.is_video_note:
+            return self.client.send_video_note(
+                chat_id, path, progress=progress
+            )
+
+        send = {
+            types.InputMediaPhoto: self.client.send_photo,
+            types.InputMediaVideo: self.client.send_video,
+            types.InputMediaAudio: self.client.send_audio,
+        }.get(self.prepare_file(path), self.client.send_document)
+        return send(
+            chat_id,
+            path,
+            caption=PRELOAD_CAPTION,
+            progress=progress,
+        )
+
+    def upload_stream(
+        self,
+        chat_id: "int | str",
+        source: "FileSource",
+        preload: FilePreload,
+        progress=None,
+    ) -> types.Message:
+        """Upload ``source`` part by part, then send it as a document.
 
+        Parts are sent as soon as the bytes are on disk, and the saved
+        part count is stored on ``preload`` so a failed preload resumes
+        where it stopped.
+        """
+        input_file = self._save_parts(source, preload, progress)
+        try:
+            return self._run(
+                send_uploaded_file(
+                    self._pooled.client, chat_id, input_file, source.name
+                )
+            )
+        except errors.FilePartMissing as e:
+            preload.parts_uploaded = min(preload.parts_uploaded, e.value)
+            input_file = self._save_parts(source, preload, progress)
+            return self._run(
+                send_uploaded_file(
+                    self._pooled.client, chat_id, input_file, source.name
+                )
+            )
+
+    def _save_parts(
+        self, source: "FileSource", preload: FilePreload, progress=None
+    ):
+        size = source.size
+        big = size > BIG_FILE_SIZE
+        total_parts = max(1, math.ceil(size / UPLOAD_PART_SIZE))
+        if preload.telegram_upload_id is None:
+            preload.telegram_upload_id = self.client.rnd_id()
+            preload.parts_uploaded = 0
+
+        part = preload.parts_uploaded
+        while part < total_parts:
+            batch = []
+            for index in range(part, min(part + UPLOAD_WINDOW, total_parts)):
+                start = index * UPLOAD_PART_SIZE
+                end = min(size, start + UPLOAD_PART_SIZE)
+                if batch and source.available() < end:
+                    break
+                batch.append((index, source.read(start, end - start)))
+            self._run(
+                save_file_parts(
+                    self._pooled.client,
+                    preload.telegram_upload_id,
+                    total_parts if big else None,
+                    batch,
+                )
+            )
+            part += len(batch)
+            preload.parts_uploaded = part
+            FilePreload.objects.filter(pk=preload.pk).update(
+                telegram_upload_id=preload.telegram_upload_id,
+                parts_uploaded=part,
+            )
+            if progress is not None:
+                progress(min(size, part * UPLOAD_PART_SIZE), size)
+
+        if big:
+            return raw.types.InputFileBig(
+                id=preload.telegram_upload_id,
+                parts=total_parts,
+                name=source.name,
+            )
+        return raw.types.InputFile(
+            id=preload.telegram_upload_id,
+            parts=total_parts,
+            name=source.name,
+            md5_checksum="",
+        )
+
+    def publish(self, chat_id: "int | str", post: Post) -> types.Message:
         preloaded = list(
-            FileUploadedToTelegram.objects.filter(file__post=post)
+            FileUploadedToTelegram.objects.filter(
+                file__post=post, binding=self.binding
+            )
         )
+        self._ensure_fetched_peers(chat_id)
 
         files = list(PostFile.objects.filter(post=post))
         if len(preloaded) == 1 and files[0].is_video_note:
+            self._ensure_fetched_peers(preloaded[0].chat_id)
             message = self.client.copy_message(
                 chat_id,
                 preloaded[0].chat_id,
@@ -229,117 +842,277 @@ class TelegramPublisher:
                 )
             return message
 
+        if preloaded:
+            stale = [
+                preload
+                for preload in preloaded
+                if not preload.telegram_file_id
+            ]
+            if stale:
+                self._refresh_file_ids(stale)
+            try:
+                return self.client.send_media_group(
+                    chat_id, self._build_medias(post, preloaded)
+                )[0]
+            except errors.BadRequest as e:
+                if not is_file_reference_error(e):
+                    raise
+                logging.warning(f"Refreshing file references of {post.id}")
+                self._refresh_file_ids(preloaded)
+                return self.client.send_media_group(
+                    chat_id, self._build_medias(post, preloaded)
+                )[0]
+
+        return self.client.send_message(  # noqa
+            chat_id,
+            post.text,
+            parse_mode=ParseMode.HTML,
+        )
+
+    @staticmethod
+    def _build_medias(
+        post: Post, preloaded: "list[FileUploadedToTelegram]"
+    ) -> list[types.InputMedia]:
         medias = []
         for i, preload in enumerate(preloaded):
-            msg: types.Message = self.client.get_messages(
-                preload.chat_id, preload.message_id
-            )
             media_type = {
-                MessageMediaType.PHOTO: types.InputMediaPhoto,
-                MessageMediaType.VIDEO: types.InputMediaVideo,
-                MessageMediaType.AUDIO: types.InputMediaAudio,
-                MessageMediaType.DOCUMENT: types.InputMediaDocument,
-            }.get(msg.media, types.InputMediaDocument)
-
+                MessageMediaType.PHOTO.value: types.InputMediaPhoto,
+                MessageMediaType.VIDEO.value: types.InputMediaVideo,
+                MessageMediaType.AUDIO.value: types.InputMediaAudio,
+                MessageMediaType.DOCUMENT.value: types.InputMediaDocument,
+            }.get(preload.media_type, types.InputMediaDocument)
             medias.append(
                 media_type(
-                    getattr(
-                        msg, str(msg.media).split(".")[-1].lower()
-                    ).file_id,
+                    preload.telegram_file_id,
                     caption=(post.text if i == 0 else None),
                     parse_mode=ParseMode.HTML,
                 )
             )
+        return medias
 
-        if medias:
-            return self.client.send_media_group(chat_id, medias)[0]
-
-        return self.client.send_message(  # noqa
-            chat_id,
-            post.text,
-            parse_mode=ParseMode.HTML,
+    def warm_up(self, chat_ids: list, post: Post):
+        """Do the lookups of ``publish`` ahead of a scheduled send."""
+        self._ensure_fetched_peers(*chat_ids)
+        stale = FileUploadedToTelegram.objects.filter(
+            file__post=post, binding=self.binding, telegram_file_id=""
         )
+        if stale:
+            self._refresh_file_ids(list(stale))
 
-    def get_channels(self) -> List[types.Chat]:
-        channels = []
-        for dialog in self.client.get_dialogs():
-            if (
-                dialog.chat.type in (ChatType.SUPERGROUP, ChatType.CHANNEL)
-                and dialog.is_admin
-            ):
-                channels.append(dialog.chat)
-        self._fetched_peers = True
+    def _refresh_file_ids(self, preloaded: "list[FileUploadedToTelegram]"):
+        by_chat = {}
+        for preload in preloaded:
+            by_chat.setdefault(preload.chat_id, []).append(preload)
+
+        for preview_id, preloads in by_chat.items():
+            self._ensure_fetched_peers(preview_id)
+            messages: list[types.Message] = self.client.get_messages(
+                preview_id, [preload.message_id for preload in preloads]
+            )
+            for preload, message in zip(preloads, messages):
+                preload.telegram_file_id, preload.media_type = get_file_id(
+                    message
+                )
+                preload.save(update_fields=["telegram_file_id", "media_type"])
+
+    def get_channels(self) -> List[ChannelRecord]:
+        channels = self._run(settle(iter_channels, self._pooled.client))
+        self._pooled.peers_fetched_at = time.monotonic()
         return channels
 
-    def _ensure_fetched_peers(self):
-        if self._fetched_peers:
-            return
-        for _ in self.client.get_dialogs():
-            pass
-        self._fetched_peers = True
+    def get_updates_state(self) -> dict:
+        state = self.client.invoke(raw.functions.updates.GetState())
+        return {"pts": state.pts, "qts": state.qts, "date": state.date}
+
+    def get_channel_changes(
+        self, state: dict
+    ) -> tuple["dict[int, str | None] | None", dict]:
+        """Admin channels that changed since ``state``.
+
+        Returns a mapping of chat id to the current title, or to ``None``
+        when the account left the channel or lost its admin rights, and
+        the new updates state. The mapping is ``None`` when Telegram
+        says the gap is too long and a full rescan is needed.
+        """
+        changes = {}
+        while True:
+            difference = self.client.invoke(
+                raw.functions.updates.GetDifference(
+                    pts=state["pts"],
+                    date=state["date"],
+                    qts=state["qts"],
+                    pts_total_limit=DIFFERENCE_PTS_LIMIT,
+                )
+            )
+            if isinstance(difference, raw.types.updates.DifferenceEmpty):
+                return changes, {**state, "date": difference.date}
+            if isinstance(difference, raw.types.updates.DifferenceTooLong):
+                return None, state
+
+            for chat in difference.chats:
+                if isinstance(chat, raw.types.ChannelForbidden):
+                    chat_id = utils.get_peer_id(
+                        raw.types.PeerChannel(channel_id=chat.id)
+                    )
+                    changes[chat_id] = None
+                elif isinstance(chat, raw.types.Channel) and not chat.min:
+                    chat_id = utils.get_peer_id(
+                        raw.types.PeerChannel(channel_id=chat.id)
+                    )
+                    is_admin = bool(chat.admin_rights) and not chat.left
+                    changes[chat_id] = chat.title if is_admin else None
+
+            if isinstance(difference, raw.types.updates.DifferenceSlice):
+                new_state = difference.intermediate_state
+            else:
+                new_state = difference.state
+            state = {
+                "pts": new_state.pts,
+                "qts": new_state.qts,
+                "date": new_state.date,
+            }
+            if isinstance(difference, raw.types.updates.Difference):
+                return changes, state
+
+    def _ensure_fetched_peers(self, *chat_ids):
+        pooled = self._pooled
+        try:
+            for chat_id in chat_ids:
+                try:
+                    chat_id = int(chat_id)
+                except ValueError:
+                    # usernames are resolved by pyrogram itself
+                    continue
+                pooled.call(pooled.client.storage.get_peer_by_id, chat_id)
+        except KeyError:
+            # pooled clients outlive channels joined after their scan;
+            # the cooldown keeps ids no scan finds from scanning each call
+            if (
+                pooled.peers_fetched_at is not None
+                and time.monotonic() - pooled.peers_fetched_at
+                < settings.TELEGRAM_PEERS_RESCAN_COOLDOWN
+            ):
+                return
+            # scanning the dialogs stores every peer they mention
+            self.get_channels()
 
     def get_chat(self, chat_id: int) -> types.Chat:
-        self._ensure_fetched_peers()
         try:
             chat_id = int(chat_id)
         except ValueError:
             pass
+        self._ensure_fetched_peers(chat_id)
         chat = self.client.get_chat(chat_id)
         return chat
 
-    def get_views_count(self, chat_id: int, message_ids: list[int]):
-        self._ensure_fetched_peers()
-        messages: List[types.Message] = self.client.get_messages(  # noqa
-            chat_id, message_ids
+    def get_message_counters(
+        self, chat_id: int, message_ids: list[int]
+    ) -> dict[int, MessageCounters]:
+        """Read views, forwards and comment counts without fetching the
+        messages themselves. ``replies`` is ``None`` when the post has no
+        discussion thread."""
+        self._ensure_fetched_peers(chat_id)
+        peer = self.client.resolve_peer(chat_id)
+        counters = {}
+        for chunk in chunked(message_ids, COUNTERS_CHUNK_SIZE):
+            result = self.client.invoke(
+                raw.functions.messages.GetMessagesViews(
+                    peer=peer, id=chunk, increment=False
+                )
+            )
+            for message_id, views in zip(chunk, result.views):
+                counters[message_id] = MessageCounters(
+                    views=views.views if views.views is not None else -1,
+                    forwards=views.forwards or 0,
+                    replies=views.replies.replies if views.replies else None,
+                )
+        return counters
+
+    def get_reactions_counts(
+        self, chat_id: int, message_ids: list[int]
+    ) -> dict[int, int]:
+        self._ensure_fetched_peers(chat_id)
+        peer = self.client.resolve_peer(chat_id)
+        reactions = dict.fromkeys(message_ids, 0)
+        for chunk in chunked(message_ids, COUNTERS_CHUNK_SIZE):
+            result = self.client.invoke(
+                raw.functions.messages.GetMessagesReactions(
+                    peer=peer, id=chunk
+                )
+            )
+            for update in getattr(result, "updates", []):
+                if isinstance(update, raw.types.UpdateMessageReactions):
+                    reactions[update.msg_id] = sum(
+                        count.count for count in update.reactions.results
+                    )
+        return reactions
+
+    def collect_metrics(
+        self, chat_id: int, message_ids: list[int]
+    ) -> dict[int, MessageMetrics]:
+        counters = self.get_message_counters(chat_id, message_ids)
+        reactions = self.get_reactions_counts(chat_id, message_ids)
+        replies = self._run(
+            reply_counter.count(
+                self._pooled.client,
+                self.binding.id,
+                chat_id,
+                [
+                    message_id
+                    for message_id, record in counters.items()
+                    if record.replies is None
+                ],
+            )
         )
         return {
-            message.id: message.views if message.views is not None else -1
-            for message in messages
+            message_id: MessageMetrics(
+                views=record.views,
+                forwards=record.forwards,
+                reactions=reactions[message_id],
+                replies=(
+                    record.replies
+                    if record.replies is not None
+                    else replies.get(message_id, 0)
+                ),
+            )
+            for message_id, record in counters.items()
+        }
+
+    def get_views_count(self, chat_id: int, message_ids: list[int]):
+        counters = self.get_message_counters(chat_id, message_ids)
+        return {
+            message_id: record.views for message_id, record in counters.items()
         }
 
     def get_actions_count(self, chat_id: int, message_ids: list[int]):
-        self._ensure_fetched_peers()
-        messages: list[types.Message] = self.client.get_messages(  # noqa
-            chat_id, message_ids
+        metrics = self.collect_metrics(chat_id, message_ids)
+        return (
+            {
+                message_id: record.actions
+                for message_id, record in metrics.items()
+            },
+            {
+                message_id: record.reactions
+                for message_id, record in metrics.items()
+            },
         )
-        results = {}
-        reactions_dict = {}
-        for message in messages:
-            reactions = self._get_reactions_count(message.reactions) or 0
-            forwards = message.forwards or 0
-            try:
-                replies = self.client.get_discussion_replies_count(  # noqa
-                    chat_id, message.id
-                )
-            except:
-                replies = 0
-            reactions_dict[message.id] = reactions
-            results[message.id] = (
-                (reactions or 0) + (forwards or 0) + (replies or 0)
-            )
-        return results, reactions_dict
-
-    def _get_reactions_count(self, obj):
-        if obj is None:
-            return 0
-        if obj.reactions is None:
-            return 0
-        return len(obj.reactions)
 
     def get_channel_subscriber_count(self, chat_id):
-        self._ensure_fetched_peers()
+        self._ensure_fetched_peers(chat_id)
         return self.client.get_chat_members_count(chat_id)
 
     def get_engagement_rates(self, chat_id: int, message_ids: list[int]):
-        self._ensure_fetched_peers()
         subs = self.get_channel_subscriber_count(chat_id)
-        actions, reactions = self.get_actions_count(chat_id, message_ids)
+        metrics = self.collect_metrics(chat_id, message_ids)
         return {
-            message_id: actions[message_id] / subs  # noqa
+            message_id: metrics[message_id].engagement_rate(subs)
+            for message_id in message_ids
+        }, {
+            message_id: metrics[message_id].reactions
             for message_id in message_ids
-        }, reactions
+        }
 
-    def ensure_channel(self, title: str) -> types.Chat:
+    def ensure_channel(self, title: str) -> "ChannelRecord | types.Chat":
         for chat in self.get_channels():
             if chat.title == title:
                 return chat
@@ -351,55 +1124,399 @@ class TelegramPublisher:
                 "которые вы хотите опубликовать в других каналах."
             ),
         )
-        chat.archive()
+        self.client.archive_chats(chat.id)
         time.sleep(1)
         return chat
 
+    def ensure_preview_channel(self) -> int:
+        """Return the preview channel id cached on the binding.
 
-def preload_to_telegram(post_files: "list[PostFile]"):
-    files = {}
+        The cached channel is not checked here; callers report a failed
+        request through ``with_preview_channel`` and only then the
+        dialogs are scanned again.
+        """
+        binding = self.binding
+        if binding.preview_channel_id is None:
+            chat = self.ensure_channel(PREVIEW_CHANNEL_TITLE)
+            peer = self.client.resolve_peer(chat.id)
+            binding.preview_channel_id = chat.id
+            binding.preview_access_hash = peer.access_hash
+            binding.save(
+                update_fields=["preview_channel_id", "preview_access_hash"]
+            )
+        elif binding.preview_access_hash is not None:
+            self._pooled.call(
+                self._pooled.client.storage.update_peers,
+                [
+                    (
+                        binding.preview_channel_id,
+                        binding.preview_access_hash,
+                        "channel",
+                        None,
+                        None,
+                    )
+                ],
+            )
+        return binding.preview_channel_id
 
+    def with_preview_channel(self, action):
+        chat_id = self.ensure_preview_channel()
+        try:
+            return action(chat_id)
+        except PREVIEW_GONE_ERRORS:
+            logging.warning(
+                f"Preview channel {chat_id} of binding {self.binding.id} "
+                f"is gone, looking it up again"
+            )
+            with self._preview_lock:
+                if self.binding.preview_channel_id == chat_id:
+                    self.binding.preview_channel_id = None
+                    self.binding.preview_access_hash = None
+                chat_id = self.ensure_preview_channel()
+            return action(chat_id)
+
+
+async def save_file_parts(
+    client: Client,
+    file_id: int,
+    total_parts: "int | None",
+    parts: "list[tuple[int, bytes]]",
+):
+    """Save ``parts`` concurrently; ``total_parts`` is set for big files."""
+
+    def save(index: int, data: bytes):
+        if total_parts is None:
+            return raw.functions.upload.SaveFilePart(
+                file_id=file_id, file_part=index, bytes=data
+            )
+        return raw.functions.upload.SaveBigFilePart(
+            file_id=file_id,
+            file_part=index,
+            file_total_parts=total_parts,
+            bytes=data,
+        )
+
+    session = await get_media_session(client)
+    await asyncio.gather(
+        *(
+            invoke_limited(
+                client,
+                query,
+                functools.partial(session.invoke, query, sleep_threshold=0),
+            )
+            for query in (save(index, data) for index, data in parts)
+        )
+    )
+
+
+async def get_media_session(client: Client) -> Session:
+    """Media connection to the client's own DC.
+
+    File parts go through it like in pyrogram's ``save_file``, so big
+    uploads do not queue up other requests on the main connection. It
+    is kept in ``client.media_sessions`` and stopped with the client.
+    """
+    dc_id = await client.storage.dc_id()
+    async with client.media_sessions_lock:
+        session = client.media_sessions.get(dc_id)
+        if session is None:
+            session = Session(
+                client,
+                dc_id,
+                await client.storage.auth_key(),
+                await client.storage.test_mode(),
+                is_media=True,
+            )
+            await session.start()
+            client.media_sessions[dc_id] = session
+    return session
+
+
+async def send_uploaded_file(
+    client: Client, chat_id: "int | str", input_file, file_name: str
+) -> types.Message:
+    mime_type = client.guess_mime_type(file_name) or "application/octet-stream"
+    attributes = [raw.types.DocumentAttributeFilename(file_name=file_name)]
+    if mime_type.startswith("video/"):
+        attributes.append(
+            raw.types.DocumentAttributeVideo(
+                duration=0, w=0, h=0, supports_streaming=True
+            )
+        )
+    elif mime_type.startswith("audio/"):
+        attributes.append(raw.types.DocumentAttributeAudio(duration=0))
+
+    r = await client.invoke(
+        raw.functions.messages.SendMedia(
+            peer=await client.resolve_peer(chat_id),
+            media=raw.types.InputMediaUploadedDocument(
+                mime_type=mime_type,
+                file=input_file,
+                attributes=attributes,
+            ),
+            message=PRELOAD_CAPTION,
+            random_id=client.rnd_id(),
+        )
+    )
+    for update in r.updates:
+        if isinstance(
+            update,
+            (raw.types.UpdateNewMessage, raw.types.UpdateNewChannelMessage),
+        ):
+            return await types.Message._parse(
+                client,
+                update.message,
+                {user.id: user for user in r.users},
+                {chat.id: chat for chat in r.chats},
+            )
+
+
+class FileSource:
+    """Reads a post file that may still be arriving in chunks.
+
+    Reads block until the chunked upload has received the requested
+    bytes; files uploaded in one request are available right away.
+    """
+
+    POLL_INTERVAL = 0.5
+
+    def __init__(self, post_file: PostFile):
+        # opened up front: the handle outlives the move of a finished
+        # upload to its content address, a path would not
+        self._file = self._open(post_file)
+        self.path = post_file.file.path
+        self.name = post_file.name or os.path.basename(self.path)
+        self.upload = FileUpload.objects.filter(file=post_file).first()
+        self.size = self.upload.size if self.upload else post_file.file.size
+
+    @staticmethod
+    def _open(post_file: PostFile):
+        try:
+            return open(post_file.file.path, "rb")
+        except FileNotFoundError:
+            # moved since the row was loaded
+            post_file.refresh_from_db(fields=["file", "sha256"])
+            return open(post_file.file.path, "rb")
+
+    def available(self) -> int:
+        if self.upload is None:
+            return self.size
+        received, status = FileUpload.objects.values_list(
+            "received", "status"
+        ).get(pk=self.upload.pk)
+        if status == FileUpload.Status.FAILED:
+            raise IOError(f"Upload of {self.path} failed")
+        return received
+
+    def wait(self, end: int):
+        deadline = time.monotonic() + settings.TELEGRAM_UPLOAD_STALL_TIMEOUT
+        received = self.available()
+        while received < end:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Upload of {self.path} stalled")
+            time.sleep(self.POLL_INTERVAL)
+            previous, received = received, self.available()
+            if received > previous:
+                deadline = (
+                    time.monotonic() + settings.TELEGRAM_UPLOAD_STALL_TIMEOUT
+                )
+
+    def read(self, offset: int, length: int) -> bytes:
+        self.wait(offset + length)
+        self._file.seek(offset)
+        return self._file.read(length)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class PreloadProgress:
+    """pyrogram upload progress callback that records bytes sent."""
+
+    SAVE_INTERVAL = 1
+
+    def __init__(self, preload: FilePreload):
+        self.preload = preload
+        self._saved_at = 0.0
+
+    def __call__(self, current: int, total: int):
+        now = time.monotonic()
+        if current < total and now - self._saved_at < self.SAVE_INTERVAL:
+            return
+        self._saved_at = now
+        FilePreload.objects.filter(pk=self.preload.pk).update(
+            uploaded=current, total=total
+        )
+
+
+def preload_to_telegram(post_files: "list[PostFile]"):
+    groups = {}
     for file in post_files:
         for channel in file.post.target_channels.all():
-            files.setdefault(channel.binding.session_string, [])
-            files[channel.binding.session_string].append(file)
-
-    for session_string, files in files.items():
-        with TelegramPublisher(channel.binding.session_string) as tg:
-            for post_file in files:
-                logging.warning(f"Preloading file {post_file.file.path} for channel {channel.name}")
-                preview = tg.ensure_channel("smm-client-preview")
-
-                if post_file.is_video_note:
-                    logging.warning("Sending video note")
-                    message = tg.client.send_video_note(
-                        preview.id,
-                        post_file.file.path,
-                    )
-                    FileUploadedToTelegram.objects.create(
-                        file=post_file,
-                        binding=channel.binding,
-                        chat_id=message.chat.id,
-                        message_id=message.id,
-                    )
-                    continue
+            binding = channel.binding
+            groups.setdefault(binding.id, (binding, {}))
+            groups[binding.id][1][file.id] = file
 
-                media_type = tg.prepare_file(post_file.file.path)
-                medias = [
-                    media_type(
-                        post_file.file.path,
-                        caption="Этот файл был загружен в этот канал в целях быстродействия. "
-                        "Не обращайте внимания. Пожалуйста, не удаляйте его.",
-                    )
-                ]
-
-                logging.warning(f"Sending {media_type} file")
-                message = tg.client.send_media_group(preview.id, medias)[0]
-                logging.warning(f"File {post_file.file.path} uploaded to {message.chat.id}")
-                FileUploadedToTelegram.objects.create(
-                    file=post_file,
-                    binding=channel.binding,
-                    chat_id=message.chat.id,
-                    message_id=message.id,
+    if not groups:
+        return
+    with ThreadPoolExecutor(
+        max_workers=len(groups), thread_name_prefix="preload"
+    ) as executor:
+        for binding, files in groups.values():
+            executor.submit(_preload_binding, binding, list(files.values()))
+
+
+def _preload_binding(binding: UserTelegramBinding, files: "list[PostFile]"):
+    pending = []
+    try:
+        for post_file in files:
+            preload, _ = FilePreload.objects.get_or_create(
+                file=post_file, binding=binding
+            )
+            if _claim(preload):
+                pending.append(preload)
+
+        # one upload per content, the copies reuse its file id
+        first, copies, seen = [], [], set()
+        for preload in pending:
+            sha256 = preload.file.sha256
+            if _reuse_upload(preload):
+                continue
+            if sha256 and sha256 in seen:
+                copies.append(preload)
+            else:
+                seen.add(sha256)
+                first.append(preload)
+        if not first:
+            return
+
+        with TelegramPublisher(binding) as tg:
+            tg.ensure_preview_channel()
+            with ThreadPoolExecutor(
+                max_workers=settings.TELEGRAM_PRELOAD_CONCURRENCY,
+                thread_name_prefix=f"preload-{binding.id}",
+            ) as executor:
+                for preload in first:
+                    executor.submit(_preload_file, tg, preload)
+            for preload in copies:
+                if not _reuse_upload(preload):
+                    _preload_file(tg, preload)
+    except Exception as e:
+        logging.exception(f"Failed to preload files for binding {binding.id}")
+        # claimed preloads that never got to upload are retried later
+        FilePreload.objects.filter(
+            pk__in=[preload.pk for preload in pending],
+            status=FilePreload.Status.UPLOADING,
+        ).update(status=FilePreload.Status.FAILED, error=str(e))
+    finally:
+        connection.close()
+
+
+def _claim(preload: FilePreload) -> bool:
+    """Take ``preload`` over unless it is done or uploading already.
+
+    The retry job and the threads started by uploads may pick the same
+    preload; only the one whose update matches uploads the file.
+    """
+    claimed = FilePreload.objects.filter(
+        pk=preload.pk,
+        status__in=[FilePreload.Status.PENDING, FilePreload.Status.FAILED],
+    ).update(status=FilePreload.Status.UPLOADING)
+    if claimed:
+        preload.status = FilePreload.Status.UPLOADING
+    return claimed == 1
+
+
+def _reuse_upload(preload: FilePreload) -> bool:
+    """Point ``preload`` at an earlier upload of the same content."""
+    post_file = preload.file
+    if not post_file.sha256:
+        return False
+    known = (
+        FileUploadedToTelegram.objects.filter(
+            sha256=post_file.sha256,
+            binding=preload.binding,
+            file__is_video_note=post_file.is_video_note,
+        )
+        .exclude(telegram_file_id="")
+        .exclude(file=post_file)
+        .first()
+    )
+    if known is None:
+        return False
+
+    FileUploadedToTelegram.objects.create(
+        file=post_file,
+        binding=preload.binding,
+        chat_id=known.chat_id,
+        message_id=known.message_id,
+        telegram_file_id=known.telegram_file_id,
+        media_type=known.media_type,
+        sha256=known.sha256,
+    )
+    preload.status = FilePreload.Status.DONE
+    preload.total = preload.uploaded = post_file.file.size
+    preload.error = ""
+    preload.save()
+    return True
+
+
+def _preload_file(tg: TelegramPublisher, preload: FilePreload):
+    post_file = preload.file
+    logging.warning(
+        f"Preloading file {post_file.file.path} for binding {preload.binding_id}"
+    )
+    source = None
+    try:
+        source = FileSource(post_file)
+        preload.status = FilePreload.Status.UPLOADING
+        preload.attempts += 1
+        preload.total = source.size
+        preload.error = ""
+        preload.save()
+        progress = PreloadProgress(preload)
+        mime_type = tg.client.guess_mime_type(source.name) or ""
+        if post_file.is_video_note or mime_type.startswith("image/"):
+            # photos are checked and video notes are sent by pyrogram,
+            # both need the whole file
+            source.wait(source.size)
+            post_file.refresh_from_db(fields=["file", "sha256"])
+            message = tg.with_preview_channel(
+                lambda chat_id: tg.upload_file(
+                    chat_id, post_file, progress=progress
+                )
+            )
+        else:
+            message = tg.with_preview_channel(
+                lambda chat_id: tg.upload_stream(
+                    chat_id, source, preload, progress=progress
                 )
-                time.sleep(0.1)
+            )
+        file_id, media_type = get_file_id(message)
+        post_file.refresh_from_db(fields=["sha256"])
+        FileUploadedToTelegram.objects.create(
+            file=post_file,
+            binding=preload.binding,
+            chat_id=message.chat.id,
+            message_id=message.id,
+            telegram_file_id=file_id,
+            media_type=media_type,
+            sha256=post_file.sha256,
+        )
+    except Exception as e:
+        logging.exception(f"Failed to preload file {post_file.file.path}")
+        preload.status = FilePreload.Status.FAILED
+        preload.error = str(e)
+    else:
+        logging.warning(
+            f"File {post_file.file.path} uploaded to {message.chat.id}"
+        )
+        preload.status = FilePreload.Status.DONE
+        preload.uploaded = preload.total
+    finally:
+        if source is not None:
+            source.close()
+        preload.save()
+        connection.close()